@@ -14,6 +14,35 @@ import logging
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Upper bound on the authorization header length. Legitimate tokens, including OIDC
+# access tokens, are well under this, and it is public, so it reveals nothing about the
+# expected token. It stops oversized headers from being stripped, encoded and compared
+MAX_AUTH_HEADER_LENGTH = 4096
+
+
+def _find_auth_header(headers):
+    """
+    Find the authorization header value using case-insensitive header names.
+    
+    Scans the headers once, lowercasing each name a single time, and returns as soon as
+    a non-empty x-api-key header is found since it takes precedence over Authorization.
+    
+    Args:
+        headers (dict): HTTP headers from the request
+        
+    Returns:
+        str or None: The x-api-key value if present, otherwise the Authorization value (or None)
+    """
+    authorization = None
+    for name, value in headers.items():
+        name = name.lower()
+        if name == 'x-api-key':
+            if value:
+                return value
+        elif name == 'authorization':
+            authorization = value
+    return authorization
+
 
 def authenticate_request(event, expected_token):
     """
@@ -32,6 +61,7 @@ def authenticate_request(event, expected_token):
         - x-api-key takes precedence over Authorization header if both present
         - Automatic Bearer token prefix handling
         - Whitespace trimming and validation
+        - Headers longer than MAX_AUTH_HEADER_LENGTH are rejected before comparison
     
     Security Features:
         - Constant-time token comparison using hmac.compare_digest()
@@ -41,7 +71,8 @@ def authenticate_request(event, expected_token):
     Args:
         event (dict): Lambda event object containing request data including:
             - headers (dict): HTTP headers from the request
-        expected_token: token value used for comparison
+        expected_token (bytes or str): token value used for comparison. UTF-8 encoded
+            bytes are preferred so the value is not re-encoded on every request
     
     Returns:
         dict: Authentication result with the following structure:
@@ -62,24 +93,26 @@ def authenticate_request(event, expected_token):
     """
     try:
         # Get headers from event (handle both direct invocation and API Gateway)
-        headers = event.get('headers', {})
-        
-        # Handle case-insensitive headers
-        headers_lower = {k.lower(): v for k, v in headers.items()}
+        headers = event.get('headers') or {}
         
-        # Extract authorization header - x-api-key takes precedence
-        auth_header = headers_lower.get('x-api-key') or headers_lower.get('authorization')
+        # Extract authorization header - x-api-key takes precedence.
+        # Try the canonical key first and only fall back to a case-insensitive scan on a miss
+        auth_header = headers.get('x-api-key') or _find_auth_header(headers)
         
         if auth_header is None:
             return {'success': False, 'error': 'Missing authorization header'}
         
+        if len(auth_header) > MAX_AUTH_HEADER_LENGTH:
+            return {'success': False, 'error': 'Invalid authorization token'}
+        
         # Check if header exists but is empty
         if not auth_header.strip():
             return {'success': False, 'error': 'Empty authorization token'}
         
         # Extract token from header (handle "Bearer token" or just "token")
         token = auth_header
-        if auth_header.lower().startswith('bearer '):
+        # Only lowercase the prefix, since tokens can be several kilobytes long
+        if auth_header[:7].lower() == 'bearer ':
             token = auth_header[7:]  # Remove "Bearer " prefix
         
         token = token.strip()
@@ -90,8 +123,13 @@ def authenticate_request(event, expected_token):
         if not expected_token:
             return {'success': False, 'error': 'Authentication not configured'}
         
+        # Compare tokens as bytes. Callers should pass pre-encoded bytes so the
+        # expected token is only encoded once rather than on every request
+        if isinstance(expected_token, str):
+            expected_token = expected_token.encode('utf-8')
+        
         # Compare tokens (constant time comparison for security)
-        if not hmac.compare_digest(token, expected_token):
+        if not hmac.compare_digest(token.encode('utf-8'), expected_token):
             return {'success': False, 'error': 'Invalid authorization token'}
         
         return {'success': True, 'error': None}
@@ -1,25 +1,46 @@
 import json
 import os
+try:
+    import orjson
+except ImportError:
+    orjson = None
 from auth import authenticate_request
-from manage_firmware import manageFirmware
-from notehub import NotehubProject
+from manage_firmware import manageFirmware, connectToNotehubProject
 from rules import DevicesInUpdateFleet
 
+# The auth token cannot change within a running Lambda container, so read and encode it once
+_EXPECTED_TOKEN = (os.getenv("FIRMWARE_CHECK_AUTH_TOKEN") or "").encode("utf-8")
+
+_TRUE_STRINGS = frozenset(('true', '1', 'yes', 'on'))
+
+# orjson is considerably faster than the standard library, so use it when it is deployed
+if orjson is not None:
+    json_loads = orjson.loads
+
+    def json_dumps(obj):
+        # API Gateway expects a str body for non-binary responses
+        return orjson.dumps(obj).decode('utf-8')
+else:
+    json_loads = json.loads
+    json_dumps = json.dumps
+
 def str_to_bool(value):
-      """
-      Convert a string representation of a boolean to its boolean equivalent.
-      Returns False for None input.
-      
-      Args:
-          value: String or None
-          
-      Returns:
-          bool: True for 'true', '1', 'yes', 'on' (case-insensitive), False 
-  otherwise
-      """
-      if value is None:
-          return False
-      return str(value).lower() in ('true', '1', 'yes', 'on')
+    """
+    Convert a string representation of a boolean to its boolean equivalent.
+    Returns False for None input.
+    
+    Args:
+        value: String or None
+        
+    Returns:
+        bool: True for 'true', '1', 'yes', 'on' (case-insensitive), False otherwise
+    """
+    if value is None:
+        return False
+    if isinstance(value, str):
+        # Values are usually already lowercase, so try them before lowercasing
+        return value in _TRUE_STRINGS or value.lower() in _TRUE_STRINGS
+    return str(value).lower() in _TRUE_STRINGS
 
 def parse_firmware_json(firmware_data):
     """
@@ -37,65 +58,61 @@ def parse_firmware_json(firmware_data):
     if not isinstance(firmware_data, str):
         return firmware_data
     
-    # Check if string looks like JSON (starts with { and ends with })
-    stripped = firmware_data.strip()
-    if not (stripped.startswith('{') and stripped.endswith('}')):
+    # Check if string looks like JSON (starts with { and ends with }).
+    # Reject on the first character where possible so plain values skip the strip() copy
+    first = firmware_data[:1]
+    if first != '{' and not first.isspace():
         return firmware_data
     
+    stripped = firmware_data
+    if first != '{' or firmware_data[-1:] != '}':
+        stripped = firmware_data.strip()
+        if stripped[:1] != '{' or stripped[-1:] != '}':
+            return firmware_data
+    
+    # Object keys are always quoted, so a string without quotes is either an empty
+    # object or malformed. Decide that here rather than raising inside the parser
+    if '"' not in stripped:
+        return {} if not stripped[1:-1].strip() else firmware_data
+    
     try:
-        parsed = json.loads(firmware_data)
+        parsed = json_loads(firmware_data)
         return parsed
     except (json.JSONDecodeError, ValueError):
         # If parsing fails, return the original string
         return firmware_data
 
-def parse_firmware_fields(payload):
+def parse_firmware_fields_inplace(payload):
     """
-    Parse firmware_notecard and firmware_host fields if they are JSON strings.
+    Parse firmware_notecard and firmware_host fields in place if they are JSON strings.
+    
+    The payload is modified rather than copied, since the request payload is not
+    needed in its unparsed form once it has been decoded.
     
     Args:
         payload (dict): Request payload that may contain firmware fields
         
     Returns:
-        dict: Payload with parsed firmware fields
+        dict: The same payload, with parsed firmware fields
     """
-    # Create a copy to avoid modifying the original
-    parsed_payload = payload.copy()
-    
     # Parse firmware_notecard if present
-    if 'firmware_notecard' in parsed_payload:
-        parsed_payload['firmware_notecard'] = parse_firmware_json(parsed_payload['firmware_notecard'])
+    if 'firmware_notecard' in payload:
+        payload['firmware_notecard'] = parse_firmware_json(payload['firmware_notecard'])
     
     # Parse firmware_host if present  
-    if 'firmware_host' in parsed_payload:
-        parsed_payload['firmware_host'] = parse_firmware_json(parsed_payload['firmware_host'])
+    if 'firmware_host' in payload:
+        payload['firmware_host'] = parse_firmware_json(payload['firmware_host'])
     
-    return parsed_payload
-
-def retrieveAuthToken():
-    return os.getenv("FIRMWARE_CHECK_AUTH_TOKEN")
-
-def connectToNotehubProject():
-    PROJECT_UID = os.getenv("NOTEHUB_PROJECT_UID")
-    NOTEHUB_CLIENT_ID = os.getenv("NOTEHUB_CLIENT_ID")
-    NOTEHUB_CLIENT_SECRET = os.getenv("NOTEHUB_CLIENT_SECRET")
-
-    return NotehubProject(project_uid=PROJECT_UID, client_id=NOTEHUB_CLIENT_ID, client_secret=NOTEHUB_CLIENT_SECRET)
-
-project = None
+    return payload
 
 def processRoutedSession(deviceUID, payload, is_dry_run):
 
-
-    global project
-
-    if project is None:
-        project = connectToNotehubProject()
+    project = connectToNotehubProject()
 
     return manageFirmware(project, deviceUID, payload, rules=DevicesInUpdateFleet, is_dry_run=is_dry_run)
 
 def lambda_handler(event, context):
-    result = authenticate_request(event, retrieveAuthToken())
+    result = authenticate_request(event, _EXPECTED_TOKEN)
     if not result.get('success', False):
         return {
             'statusCode': 401,
@@ -105,7 +122,7 @@ def lambda_handler(event, context):
     try:
         payload = event["body"]
         if not isinstance(payload, dict):
-            payload = json.loads(payload)
+            payload = json_loads(payload)
 
         deviceUID = payload.get("device")
         if not deviceUID or not isinstance(deviceUID, str):
@@ -114,23 +131,33 @@ def lambda_handler(event, context):
                 'body': "bad request. missing valid device UID from the request"
             }
         
+        # API Gateway sends None rather than an empty dict when there are no headers or query parameters
+        headers = event.get("headers") or {}
+        queryStringParameters = event.get("queryStringParameters") or {}
+        
         is_dry_run = bool( str_to_bool(payload.get('is_dry_run')) 
-                        or str_to_bool(event.get("headers",{}).get('x-dry-run'))
-                        or str_to_bool(event.get("queryStringParameters",{}).get('is_dry_run'))
+                        or str_to_bool(headers.get('x-dry-run'))
+                        or str_to_bool(queryStringParameters.get('is_dry_run'))
                     )
         
         # Parse firmware fields if they are JSON strings
-        parsed_payload = parse_firmware_fields(payload)
+        parse_firmware_fields_inplace(payload)
         
-        r = processRoutedSession(deviceUID, parsed_payload, is_dry_run)
+        r = processRoutedSession(deviceUID, payload, is_dry_run)
     except Exception as e:
         return {
             'statusCode': 500,
-            'body': json.dumps({"error":str(e),"request_payload":event["body"]})
+            'body': json_dumps({"error":str(e),"request_payload":event["body"]})
         }
+    
+    body = {"response":r}
+    # Echoing the request payload back is only useful for debugging, so it is opt-in
+    if str_to_bool(headers.get('x-debug-echo')):
+        body["request_payload"] = payload
+    
     return {
         'statusCode': 200,
-        'body': json.dumps({"response":r,"request_payload":payload})
+        'body': json_dumps(body)
     }
 
 if __name__ == "__main__":
@@ -1,97 +1,242 @@
 import os
 import time
-from notehub import NotehubProject, FirmwareType
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import itemgetter
+from notehub import NotehubProject, FirmwareType, executor
 from rules_engine import getFirmwareUpdateTargets, DEFAULT_RULES
 
+# Environment variables cannot change within a running Lambda container, so read them once
+_PROJECT_UID = os.getenv("NOTEHUB_PROJECT_UID")
+_NOTEHUB_CLIENT_ID = os.getenv("NOTEHUB_CLIENT_ID")
+_NOTEHUB_CLIENT_SECRET = os.getenv("NOTEHUB_CLIENT_SECRET")
+
+# Cached so warm Lambda invocations reuse the same project, its OAuth token and
+# the pooled Notehub connections instead of reconnecting on every request
+@lru_cache(maxsize=1)
 def connectToNotehubProject():
-    PROJECT_UID = os.getenv("NOTEHUB_PROJECT_UID")
-    NOTEHUB_CLIENT_ID = os.getenv("NOTEHUB_CLIENT_ID")
-    NOTEHUB_CLIENT_SECRET = os.getenv("NOTEHUB_CLIENT_SECRET")
+    # Fail before any Notehub request is made rather than with an authentication error later
+    if not (_PROJECT_UID and _NOTEHUB_CLIENT_ID and _NOTEHUB_CLIENT_SECRET):
+        raise(Exception("Notehub credentials not configured. Set NOTEHUB_PROJECT_UID, NOTEHUB_CLIENT_ID and NOTEHUB_CLIENT_SECRET"))
+
+    return NotehubProject(project_uid=_PROJECT_UID, client_id=_NOTEHUB_CLIENT_ID, client_secret=_NOTEHUB_CLIENT_SECRET)
+
+# FirmwareType values are plain strings, which hash and compare quickly as dict keys.
+# Bind them to module globals so hot paths skip the class attribute lookups
+_NOTECARD = FirmwareType.Notecard
+_HOST = FirmwareType.Host
+
+# Firmware types that can be requested from the firmware cache
+_FIRMWARE_TYPES = frozenset((_NOTECARD, _HOST))
 
-    return NotehubProject(project_uid=PROJECT_UID, client_id=NOTEHUB_CLIENT_ID, client_secret=NOTEHUB_CLIENT_SECRET)
+# Extracts the (type, version, filename) of a firmware library entry in one call
+_catalogEntry = itemgetter('type', 'version', 'filename')
 
 class FirmwareCache:
 
+    __slots__ = ('cache', 'cache_expiry', '_expiration_duration_seconds', '_refresh_ahead_seconds', '_catalog_sig', '_lock', '_refreshing')
+
     def __init__(self) -> None:
         self.cache = {}
         self.cache_expiry = 0
         self._expiration_duration_seconds = 1800
+        # Refresh in the background during the last quarter of the cache lifetime
+        self._refresh_ahead_seconds = self._expiration_duration_seconds // 4
+        self._catalog_sig = None
+        self._lock = threading.Lock()
+        self._refreshing = False
 
     def update(self, project):
-        ts = time.time()
+        ts = time.monotonic()
         response = project.fetchAvailableFirmware()
 
-        c = {FirmwareType.Notecard:{}, FirmwareType.Host:{}}
+        entries = []
         for i in response:
-            t = i.get('type')
-            v = i.get('version')
-            f = i.get('filename')
-            if t is None or v is None or f is None:
+            try:
+                entry = _catalogEntry(i)
+            except KeyError:
                 continue
-            c[t][v] = f
-
-        self.cache = c
-        self.cache_expiry = ts + self._expiration_duration_seconds
-
+            if None not in entry:
+                entries.append(entry)
+        entries = tuple(entries)
 
-            
+        # The firmware library rarely changes between refreshes, so only rebuild
+        # the cache when the catalog differs from the one it was built from
+        if entries != self._catalog_sig:
+            # Keyed by (firmware type, version) so a lookup is a single hash
+            self.cache = {(t, v): f for t, v, f in entries}
+            self._catalog_sig = entries
 
-    def retrieve(self, project, firmwareType, version):
-        if self._cacheIsExpired():
-            self.update(project)
+        self.cache_expiry = ts + self._expiration_duration_seconds
 
-        if firmwareType not in self.cache:
-            raise(Exception(f"Firmware for {firmwareType} not available in local firmware cache. Check your Notehub project's firmware library."))
+    def _refreshAhead(self, project):
+        try:
+            with self._lock:
+                # A caller may have refreshed the cache while this was queued
+                if time.monotonic() >= self.cache_expiry - self._refresh_ahead_seconds:
+                    self.update(project)
+        finally:
+            self._refreshing = False
+
+    def try_retrieve(self, project, firmwareType, version):
+        """
+        Look up the firmware file name without raising when it is not in the cache.
         
-        if version not in self.cache[firmwareType]:
-            available_versions = list(self.cache[firmwareType].keys())
+        Returns:
+            tuple: (True, file name) if found, otherwise (False, reason it is unavailable)
+        """
+        # Monotonic clock so wall-clock adjustments can't stall or stampede the refresh
+        now = time.monotonic()
+        if now >= self.cache_expiry:
+            # Only one caller refreshes an expired cache; the others wait and reuse its result
+            with self._lock:
+                if time.monotonic() >= self.cache_expiry:
+                    self.update(project)
+        elif now >= self.cache_expiry - self._refresh_ahead_seconds and not self._refreshing:
+            # Close to expiry: keep serving the current cache and refresh it in the background.
+            # A failed background refresh is retried synchronously once the cache expires
+            self._refreshing = True
+            executor.submit(self._refreshAhead, project)
+
+        # update() swaps in a new dict, so use one snapshot for all lookups below
+        cache = self.cache
+        key = (firmwareType, version)
+
+        if key not in cache:
+            if firmwareType not in _FIRMWARE_TYPES:
+                return False, f"Firmware for {firmwareType} not available in local firmware cache. Check your Notehub project's firmware library."
+            
+            available_versions = [v for (t, v) in cache if t == firmwareType]
             if available_versions:
                 versions_list = ", ".join(sorted(available_versions))
-                raise(Exception(f"Firmware version {version} for {firmwareType} not available in local firmware cache. Available versions: {versions_list}. Please update your rules to use an available version or upload the missing firmware to your Notehub project."))
+                return False, f"Firmware version {version} for {firmwareType} not available in local firmware cache. Available versions: {versions_list}. Please update your rules to use an available version or upload the missing firmware to your Notehub project."
             else:
-                raise(Exception(f"Firmware version {version} for {firmwareType} not available in local firmware cache. No firmware versions found for {firmwareType}. Please upload firmware to your Notehub project."))
+                return False, f"Firmware version {version} for {firmwareType} not available in local firmware cache. No firmware versions found for {firmwareType}. Please upload firmware to your Notehub project."
         
-        f = self.cache[firmwareType][version]
+        f = cache[key]
         if not isinstance(f, str) or f == "":
-            raise(Exception(f"Invalid firmware file name for version {version} for {firmwareType} not available in local firmware cache"))
+            return False, f"Invalid firmware file name for version {version} for {firmwareType} not available in local firmware cache"
         
-        return f
+        return True, f
 
-    def _cacheIsExpired(self):
-        return time.time() >= self.cache_expiry
+    def retrieve(self, project, firmwareType, version):
+        found, f = self.try_retrieve(project, firmwareType, version)
+        if not found:
+            raise(Exception(f))
+        
+        return f
 
 firmwareCache = FirmwareCache()
 
 
+class DeviceStatusCache:
+    """
+    Short-lived cache of per-device Notehub lookups, keyed by (deviceUID, kind).
+    
+    Devices are often processed again within seconds (retries, or a dry-run followed by
+    the real run), so firmware info and DFU status are reused until they expire.
+    """
+
+    __slots__ = ('cache', '_expiration_duration_seconds', '_max_entries', '_lock')
+
+    def __init__(self, expiration_duration_seconds=30, max_entries=1024) -> None:
+        self.cache = {}
+        self._expiration_duration_seconds = expiration_duration_seconds
+        self._max_entries = max_entries
+        # Devices are managed concurrently, so guard the pruning and invalidation scans
+        # against inserts from other threads. Fetches run outside the lock
+        self._lock = threading.Lock()
+
+    def retrieve(self, key, fetch):
+        now = time.monotonic()
+        entry = self.cache.get(key)
+        if entry is not None and now < entry[1]:
+            return entry[0]
+
+        value = fetch()
+
+        with self._lock:
+            cache = self.cache
+            # Re-inserting moves the key to the end, so the cache stays in expiry order
+            # and the expired and oldest entries are at the front
+            cache.pop(key, None)
+            if len(cache) >= self._max_entries:
+                # Drop the expired entries, and the oldest ones while it is still full
+                while cache:
+                    oldest = next(iter(cache))
+                    if len(cache) < self._max_entries and now < cache[oldest][1]:
+                        break
+                    del cache[oldest]
+
+            cache[key] = (value, now + self._expiration_duration_seconds)
+        return value
+
+    def invalidate(self, deviceUID):
+        with self._lock:
+            for key in [k for k in self.cache if k[0] == deviceUID]:
+                del self.cache[key]
+
+deviceStatusCache = DeviceStatusCache()
+
+# Key for the combined DFU status of a device in the device status cache
+DFU_STATUS = "dfu_status"
+
+# Fixed messages, built once rather than formatted for every device
+_NO_UPDATE_REQUEST_MSG = {t: f"No firmware update request for {t}" for t in (_NOTECARD, _HOST)}
+_DFU_IN_PROGRESS_MSG = (
+    (_NOTECARD, "firmware requirements NOT met.  Update not requested because Notecard update is in progress"),
+    (_HOST, "firmware requirements NOT met.  Update not requested because Host update is in progress"),
+)
+
+
 
 
 def fetchDeviceFirmwareInfo(project, deviceUID, firmwareType):
     d = project.getDeviceFirmwareUpdateHistory(deviceUID, firmwareType)
-    return d.get("current",{})
+    # Only build an empty dict when there is no current firmware info. The result is
+    # stored in the request payload, so it must stay a JSON serializable dict
+    return d.get("current") or {}
+
+def fetchCachedDeviceFirmwareInfo(project, deviceUID, firmwareType):
+    return deviceStatusCache.retrieve((deviceUID, firmwareType), lambda: fetchDeviceFirmwareInfo(project, deviceUID, firmwareType))
+
+def firmwareVersion(firmwareInfo):
+    """
+    Get the version from firmware info that is either a firmware info object or a bare version string.
+    """
+    if isinstance(firmwareInfo, dict):
+        return firmwareInfo.get("version")
+    
+    if isinstance(firmwareInfo, str):
+        return firmwareInfo
+    
+    return None
     
 
-def checkUpdateToTargetVersion(project, deviceUID, currentVersion, target_versions, firmwareType):
+def checkUpdateToTargetVersion(project, deviceUID, currentVersion, targetVersion, firmwareType):
     """
-    Check if a firmware update should be performed and validate the request.
+    Check if a firmware update to targetVersion should be performed and validate the request.
     
     Returns:
         tuple: (should_update: bool, message: str, target_version: str, filename: str)
     """
-    fw = target_versions.get(firmwareType)
-    
-    if (fw is None):
-        return False, f"No firmware update request for {firmwareType}", None, None
+    if (targetVersion is None):
+        return False, _NO_UPDATE_REQUEST_MSG.get(firmwareType) or f"No firmware update request for {firmwareType}", None, None
 
-    if (fw == currentVersion):
-        return False, f"Skipping update request for {firmwareType}. Already at target version of {fw}.", fw, None
+    if (targetVersion == currentVersion):
+        return False, f"Skipping update request for {firmwareType}. Already at target version of {targetVersion}.", targetVersion, None
     
     try:
-        file = firmwareCache.retrieve(project, firmwareType, fw)
-        if file is None:
-            raise(Exception(f"Unable to locate {firmwareType} firmware image for requested version {fw}. Please check available firmware in your Notehub project."))
-        return True, f"Would request {firmwareType} firmware update from {currentVersion} to {fw}.", fw, file
+        found, file = firmwareCache.try_retrieve(project, firmwareType, targetVersion)
     except Exception as e:
-        return False, f"Cannot update {firmwareType}: {str(e)}", fw, None
+        # Refreshing the firmware cache from Notehub failed
+        return False, f"Cannot update {firmwareType}: {str(e)}", targetVersion, None
+    
+    if not found:
+        return False, f"Cannot update {firmwareType}: {file}", targetVersion, None
+    
+    return True, f"Would request {firmwareType} firmware update from {currentVersion} to {targetVersion}.", targetVersion, file
 
 
 def executeUpdateToTargetVersion(project, deviceUID, filename, firmwareType, currentVersion, targetVersion):
@@ -99,18 +244,42 @@ def executeUpdateToTargetVersion(project, deviceUID, filename, firmwareType, cur
     Execute the actual firmware update request to Notehub.
     """
     project.requestDeviceFirmwareUpdate(deviceUID, filename, firmwareType)
+    # The cached firmware info and DFU status for the device are now stale
+    deviceStatusCache.invalidate(deviceUID)
     return f"Requested {firmwareType} firmware update from {currentVersion} to {targetVersion}."
 
 
 
-def manageFirmware(project, deviceUID, device_data, rules={}, is_dry_run=False):
+def ensureCurrentVersions(project, deviceUID, device_data):
+    """
+    Make sure device_data has the device's current Notecard and Host firmware info.
+    
+    Only firmware info missing from device_data is fetched from Notehub, concurrently
+    when both are missing. Fetched info is stored in device_data so the rules can use it
+    and later calls with the same device_data don't fetch it again.
+    
+    Returns:
+        tuple: (Notecard firmware version, Host firmware version)
+    """
+    notecardInfo = device_data.get("firmware_notecard")
+    hostInfo = device_data.get("firmware_host")
+
+    if notecardInfo is None and hostInfo is None:
+        # Fetch both firmware histories concurrently, running one on the calling thread
+        notecardInfoFuture = executor.submit(fetchCachedDeviceFirmwareInfo, project, deviceUID, _NOTECARD)
+        hostInfo = device_data["firmware_host"] = fetchCachedDeviceFirmwareInfo(project, deviceUID, _HOST)
+        notecardInfo = device_data["firmware_notecard"] = notecardInfoFuture.result()
+    elif notecardInfo is None:
+        notecardInfo = device_data["firmware_notecard"] = fetchCachedDeviceFirmwareInfo(project, deviceUID, _NOTECARD)
+    elif hostInfo is None:
+        hostInfo = device_data["firmware_host"] = fetchCachedDeviceFirmwareInfo(project, deviceUID, _HOST)
 
-    if device_data.get("firmware_notecard") is None:
-        device_data["firmware_notecard"] = fetchDeviceFirmwareInfo(project, deviceUID, FirmwareType.Notecard)
+    return firmwareVersion(notecardInfo), firmwareVersion(hostInfo)
 
-    if device_data.get("firmware_host") is None:
-        device_data["firmware_host"] = fetchDeviceFirmwareInfo(project, deviceUID, FirmwareType.Host)
 
+def manageFirmware(project, deviceUID, device_data, rules={}, is_dry_run=False):
+
+    notecardFirmwareVersion, hostFirmwareVersion = ensureCurrentVersions(project, deviceUID, device_data)
     
     (ruleID, target_versions) = getFirmwareUpdateTargets(device_data, rules)
 
@@ -125,34 +294,70 @@ def manageFirmware(project, deviceUID, device_data, rules={}, is_dry_run=False):
         return f"{dry_run_prefix}{ruleMessage} firmware requirements met, no updates required"
     
     
-    updateStatus = project.getDeviceFirmwareUpdateStatus(deviceUID, FirmwareType.Notecard)
+    notecardTargetVersion = target_versions.get(_NOTECARD)
+    hostTargetVersion = target_versions.get(_HOST)
 
-    if updateStatus.get("dfu_in_progress", False):
-        return f"{dry_run_prefix}{ruleMessage} firmware requirements NOT met.  Update not requested because Notecard update is in progress"
-    
-    updateStatus = project.getDeviceFirmwareUpdateStatus(deviceUID, FirmwareType.Host)
-
-    if updateStatus.get("dfu_in_progress", False):
-        return f"{dry_run_prefix}{ruleMessage} firmware requirements NOT met.  Update not requested because Host update is in progress"
-    
+    # Devices already at their target versions can't be sent an update, so only
+    # check for pending updates when at least one firmware differs from its target
+    if notecardTargetVersion not in (None, notecardFirmwareVersion) or hostTargetVersion not in (None, hostFirmwareVersion):
+        updateStatus = deviceStatusCache.retrieve((deviceUID, DFU_STATUS), lambda: project.getDeviceFirmwareUpdateStatusAll(deviceUID))
 
-    # Extract current versions from device_data for update requests
-    notecardFirmwareVersion = device_data.get("firmware_notecard", {}).get("version")
-    hostFirmwareVersion = device_data.get("firmware_host", {}).get("version")
+        for firmwareType, inProgressMessage in _DFU_IN_PROGRESS_MSG:
+            if updateStatus[firmwareType].get("dfu_in_progress", False):
+                return f"{dry_run_prefix}{ruleMessage} {inProgressMessage}"
     
-    nc_should_update, nc_message, nc_target_version, nc_filename = checkUpdateToTargetVersion(project, deviceUID, notecardFirmwareVersion, target_versions, FirmwareType.Notecard)
-    host_should_update, host_message, host_target_version, host_filename = checkUpdateToTargetVersion(project, deviceUID, hostFirmwareVersion, target_versions, FirmwareType.Host)
+    nc_should_update, nc_message, nc_target_version, nc_filename = checkUpdateToTargetVersion(project, deviceUID, notecardFirmwareVersion, notecardTargetVersion, _NOTECARD)
+    host_should_update, host_message, host_target_version, host_filename = checkUpdateToTargetVersion(project, deviceUID, hostFirmwareVersion, hostTargetVersion, _HOST)
 
     if not is_dry_run:
         if nc_should_update:
-            nc_message = executeUpdateToTargetVersion(project, deviceUID, nc_filename, FirmwareType.Notecard, notecardFirmwareVersion, nc_target_version)
+            nc_message = executeUpdateToTargetVersion(project, deviceUID, nc_filename, _NOTECARD, notecardFirmwareVersion, nc_target_version)
         if host_should_update:
-            host_message = executeUpdateToTargetVersion(project, deviceUID, host_filename, FirmwareType.Host, hostFirmwareVersion, host_target_version)
+            host_message = executeUpdateToTargetVersion(project, deviceUID, host_filename, _HOST, hostFirmwareVersion, host_target_version)
 
-    m = " ".join([f"{dry_run_prefix}{ruleMessage}", nc_message, host_message])
+    m = " ".join((dry_run_prefix + ruleMessage, nc_message, host_message))
     
     return m
 
+
+def manageFirmwareBulk(project, devices, rules={}, is_dry_run=False, max_workers=16):
+    """
+    Manage firmware for many devices, processing devices concurrently.
+    
+    Notehub has no bulk firmware endpoints, so the per-device requests are spread over a
+    pool of worker threads. The pool is separate from the shared executor, which
+    manageFirmware itself uses and would otherwise deadlock on.
+    
+    Args:
+        project: NotehubProject used for all devices
+        devices: dict of device UID to device data, as received in the route payload.
+                 The rules match against this data, so it must include the fields they use
+        rules: firmware update rules applied to every device
+        is_dry_run: report the updates that would be requested without requesting them
+        max_workers: maximum number of devices processed at the same time
+        
+    Returns:
+        dict: manageFirmware result message keyed by device UID. Devices that failed
+              have the error message instead
+    """
+    # Rules such as fleet membership can only be evaluated against the device data,
+    # so bare device UIDs would silently match no rules
+    if not isinstance(devices, dict):
+        raise(Exception("devices must be a dict of device UID to device data"))
+
+    if not devices:
+        return {}
+
+    def manageDevice(deviceUID, device_data):
+        try:
+            return manageFirmware(project, deviceUID, device_data, rules=rules, is_dry_run=is_dry_run)
+        except Exception as e:
+            return f"Unable to manage firmware for {deviceUID}: {str(e)}"
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(devices))) as pool:
+        futures = {deviceUID: pool.submit(manageDevice, deviceUID, device_data) for deviceUID, device_data in devices.items()}
+        return {deviceUID: f.result() for deviceUID, f in futures.items()}
+
 #MIT License
 
 #Copyright (c) 2025 Blues Inc.
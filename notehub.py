@@ -23,12 +23,113 @@
 
 import urllib3
 from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+import hashlib
 import json
+import random
+import threading
 import time
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 
-http = urllib3.PoolManager()
+# Device list pages can hold hundreds of devices, so parse responses with orjson when it is deployed
+json_loads = orjson.loads if orjson is not None else json.loads
+
+# Shared worker threads for issuing independent Notehub requests concurrently
+executor = ThreadPoolExecutor(max_workers=4)
+
+# Request a new OAuth token this long before the current one expires, so a token
+# never expires between being read and the request reaching Notehub
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+
+# OAuth tokens shared by every client in the process, keyed by a hash of the client
+# credentials, so a new client doesn't have to request a token before its first call
+_oauth_token_cache = {}
+# One lock per set of credentials, so a slow token request only holds up clients that
+# need the same token. _oauth_token_lock only guards creating these locks
+_oauth_token_locks = {}
+_oauth_token_lock = threading.Lock()
+
+_BEARER_PREFIX = "Bearer "
+
+
+def _oauthTokenLock(token_cache_key):
+    with _oauth_token_lock:
+        return _oauth_token_locks.setdefault(token_cache_key, threading.Lock())
+
+# Number of devices requested at once by getDeviceFirmwareUpdateStatusBulk
+DFU_STATUS_BULK_CHUNK_SIZE = 100
+
+# Retry policy for transient Notehub failures. Only requests that are safe to repeat
+# are retried, so a firmware update request is never sent twice
+RETRY_METHODS = frozenset(('GET', 'HEAD'))
+
+# Methods that always send a JSON body with v1 requests
+BODY_METHODS = frozenset(('POST', 'PUT', 'PATCH'))
+RETRY_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+RETRY_MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY_SECONDS = 0.25
+RETRY_MAX_DELAY_SECONDS = 2.0
+RETRY_JITTER_SECONDS = 0.1
+# Upper bound on how long a Retry-After header from Notehub is honoured for
+RETRY_MAX_RETRY_AFTER_SECONDS = 10.0
+
+# Maximum number of requests a client has in flight at once, so bulk operations
+# throttle themselves rather than being rejected by Notehub's rate limits
+MAX_CONCURRENT_REQUESTS = 16
+
+# Requests go to the API host and the OAuth host. urllib3 only keeps one idle connection
+# per host by default, so concurrent requests would each open a new TCP/TLS connection and
+# then discard it. Keep enough connections alive for every in-flight request to reuse one
+http = urllib3.PoolManager(num_pools=4, maxsize=MAX_CONCURRENT_REQUESTS, block=False)
+
+
+class NotehubError(Exception):
+    """
+    Raised when Notehub responds to a request with an unsuccessful HTTP status.
+    """
+    def __init__(self, message, status=None, retry_after=None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class NotehubAuthError(NotehubError):
+    """
+    Raised when Notehub rejects the request credentials.
+    """
+
+
+class NotehubNotFound(NotehubError):
+    """
+    Raised when the requested Notehub resource does not exist.
+    """
+
+
+# Errors with a fixed message, keyed by HTTP status
+_STATUS_ERRORS = {
+    401: (NotehubAuthError, "Notehub authentication failed. Check API token(s)"),
+    404: (NotehubNotFound, "Notehub path not found"),
+}
+
+
+def _parseRetryAfter(response):
+    """
+    Return the number of seconds requested by a Retry-After response header, or None.
+    Only the delay-seconds form is supported.
+    """
+    value = response.headers.get('Retry-After') if response.headers is not None else None
+    if not isinstance(value, str):
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
 
 
 class FirmwareType:
@@ -37,13 +138,14 @@ class FirmwareType:
     Card="notecard"
     Notecard="notecard"
 
-    @staticmethod
-    def DFUMap(firmware_type: str) -> str:
-        mapping = {
-            "host": "user",
-            "notecard": "card"
-        }
-        return mapping.get(firmware_type, None)
+    _DFU_MAP = {
+        "host": "user",
+        "notecard": "card"
+    }
+
+    @classmethod
+    def DFUMap(cls, firmware_type: str) -> str:
+        return cls._DFU_MAP.get(firmware_type, None)
 
 class NotehubClientService:
     
@@ -63,19 +165,33 @@ class NotehubClientService:
         
         self._project_uid = project_uid
         self.host = host
+        self._v1_prefix = f"{host}/v1/projects/{project_uid}/"
         self._bearer_token = None
+        # (access token, headers) for the token the headers were last built with
+        self._bearer_headers = (None, None)
+        self._request_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+        # Only set for OAuth clients
+        self._token_cache_key = None
         
         if isUserToken:
             self.getAuthHeader = self._getXSessionHeader
             self._user_access_token = user_access_token
+            self._session_headers = {**self._shared_header, "X-Session-Token": user_access_token}
             return
         
         self._client_id = client_id
         self._client_secret = client_secret
+        # Hash the credentials so the secret itself isn't kept as a dictionary key
+        self._token_cache_key = hashlib.sha256(f"{client_id}:{client_secret}".encode("utf-8")).hexdigest()
+        self._token_lock = _oauthTokenLock(self._token_cache_key)
         self.getAuthHeader = self._getOauthTokenHeader
 
+    @staticmethod
+    def _token_is_expired(token_info):
+        return time.time() >= token_info["expires_at"] - TOKEN_REFRESH_MARGIN_SECONDS
+
     def _bearer_token_is_expired(self):
-        return time.time() >= self._bearer_token["expires_at"]
+        return self._token_is_expired(self._bearer_token)
     
     def _query_oauth_for_token(self):
         url = 'https://notehub.io/oauth2/token'
@@ -90,7 +206,7 @@ class NotehubClientService:
 
         response = http.request("POST", url, headers=headers, body=s)
 
-        responseJSON = json.loads(response.data)
+        responseJSON = json_loads(response.data)
 
         if response.status == 200:
             return responseJSON
@@ -100,29 +216,55 @@ class NotehubClientService:
 
 
     def _getBearerToken(self):
-        if self._bearer_token is None or self._bearer_token_is_expired():
-            token_info = self._query_oauth_for_token()
-            token_info["expires_at"] = time.time() + token_info["expires_in"]*60
-
-            self._bearer_token = token_info
-
-        return self._bearer_token["access_token"]
+        # Work from a local copy, another thread may invalidate the token at any time
+        token_info = self._bearer_token
+        if token_info is None or self._token_is_expired(token_info):
+            # Only one thread requests a token, and other clients with the same
+            # credentials reuse it rather than requesting their own
+            with self._token_lock:
+                token_info = _oauth_token_cache.get(self._token_cache_key)
+                if token_info is None or self._token_is_expired(token_info):
+                    token_info = self._query_oauth_for_token()
+                    # expires_in is in seconds
+                    token_info["expires_at"] = time.time() + token_info["expires_in"]
+                    _oauth_token_cache[self._token_cache_key] = token_info
+
+                self._bearer_token = token_info
+
+        return token_info["access_token"]
 
             
 
 
 
+    def _invalidateBearerToken(self, access_token):
+        """
+        Discard a rejected OAuth token, so the next request fetches a new one.
+        
+        Only the given token is discarded. Another request that was rejected at the same
+        time may have already replaced it, and the replacement is kept.
+        """
+        with self._token_lock:
+            token_info = self._bearer_token
+            if token_info is not None and token_info["access_token"] == access_token:
+                self._bearer_token = None
+            cached = _oauth_token_cache.get(self._token_cache_key)
+            if cached is not None and cached["access_token"] == access_token:
+                _oauth_token_cache.pop(self._token_cache_key, None)
+
     def _getOauthTokenHeader(self):
-        headers = self._shared_header
-        headers["Authorization"] = "Bearer " + self._getBearerToken()
+        # Headers are only rebuilt when the token changes. The returned dict is shared, don't modify it
+        token = self._getBearerToken()
+        cachedToken, headers = self._bearer_headers
+        if cachedToken != token:
+            headers = {**self._shared_header, "Authorization": _BEARER_PREFIX + token}
+            self._bearer_headers = (token, headers)
 
         return headers
 
     def _getXSessionHeader(self):
-        headers = self._shared_header
-        headers["X-Session-Token"] = self._user_access_token
-
-        return headers
+        # The returned dict is shared, don't modify it
+        return self._session_headers
     
     def _request(self, *args, **kwargs):
         """
@@ -139,48 +281,98 @@ class NotehubClientService:
             http.Response: The HTTP response object for successful requests (2xx status)
             
         Raises:
-            Exception: For authentication failures (401), not found errors (404),
-                      or other HTTP errors with descriptive messages
+            NotehubAuthError: For authentication failures (401)
+            NotehubNotFound: For not found errors (404)
+            NotehubError: For other HTTP errors, with a descriptive message
+        """
+        response, auth_headers = self._sendAuthenticated(*args, **kwargs)
+
+        # An OAuth token can be revoked before it expires. Fetch a new token and try once more,
+        # a 401 means Notehub did not act on the request so it is safe to send again
+        if response.status == 401 and self._token_cache_key is not None:
+            self._invalidateBearerToken(auth_headers["Authorization"][len(_BEARER_PREFIX):])
+            response, _ = self._sendAuthenticated(*args, **kwargs)
+
+        if response.status >=200 and response.status < 300:
+            return response
+        
+        known = _STATUS_ERRORS.get(response.status)
+        if known is not None:
+            errorType, msg = known
+            raise errorType(msg, response.status)
+        
+        msg = f"Notehub Request Error: {response.status} - {response.data}"
+        retryAfter = _parseRetryAfter(response) if response.status in RETRY_STATUS_CODES else None
+        raise NotehubError(msg, response.status, retryAfter)
+
+    def _sendAuthenticated(self, *args, **kwargs):
+        """
+        Send a request with the current authentication headers.
+        
+        Returns:
+            tuple: (response, the authentication headers the request was sent with)
         """
         # Apply authentication headers
         auth_headers = self.getAuthHeader()
         
-        # Merge authentication headers with existing headers (if any)
+        # Merge authentication headers with existing headers (if any), without modifying either
         if 'headers' in kwargs:
-            kwargs['headers'].update(auth_headers)
+            kwargs['headers'] = {**kwargs['headers'], **auth_headers}
         else:
             kwargs['headers'] = auth_headers
         
         
         # Use requests.request to handle any HTTP method and arguments
-        response = http.request(*args, **kwargs)
+        with self._request_slots:
+            return http.request(*args, **kwargs), auth_headers
 
-        if response.status >=200 and response.status < 300:
-            return response
-        
-        if response.status == 401:
-            raise Exception("Notehub authentication failed. Check API token(s)")
-        
-        if response.status == 404:
-            raise Exception("Notehub path not found")
+    def _requestWithRetry(self, *args, **kwargs):
+        """
+        Execute an HTTP request like _request, retrying transient failures.
         
-        msg = f"Notehub Request Error: {response.status} - {response.data}"
-        raise Exception(msg)
+        Rate limiting, server errors and connection failures are retried with exponential
+        backoff and jitter. If Notehub sends a Retry-After header, the retry waits at least
+        that long. Only use this for requests that are safe to repeat.
+        """
+        for attempt in range(RETRY_MAX_ATTEMPTS - 1):
+            retryAfter = None
+            try:
+                return self._request(*args, **kwargs)
+            except NotehubError as e:
+                if e.status not in RETRY_STATUS_CODES:
+                    raise
+                retryAfter = e.retry_after
+            except urllib3.exceptions.HTTPError:
+                pass
+
+            delay = RETRY_BASE_DELAY_SECONDS * (2 ** attempt) + random.uniform(0, RETRY_JITTER_SECONDS)
+            delay = min(delay, RETRY_MAX_DELAY_SECONDS)
+            if retryAfter is not None:
+                delay = max(delay, min(retryAfter, RETRY_MAX_RETRY_AFTER_SECONDS))
+            time.sleep(delay)
+
+        return self._request(*args, **kwargs)
 
     
-    def v1Request(self, path, payload = {}, params = {}, method = 'GET'):
+    def v1Request(self, path, payload = None, params = None, method = 'GET'):
 
-        p = urlencode(params)
-        url = f"{self.host}/v1/projects/{self._project_uid}/{path}?{p}"
+        url = self._v1_prefix + path
+        if params:
+            # doseq sends list parameters as repeated keys, e.g. deviceUID=a&deviceUID=b
+            url += "?" + urlencode(params, doseq=True)
 
-        jsonPayload = json.dumps(payload)
+        # Requests that modify Notehub always carry a JSON body, other requests only when given a payload
+        kwargs = {}
+        if payload is not None or method in BODY_METHODS:
+            kwargs['body'] = json.dumps(payload if payload is not None else {})
 
-        response = self._request(method, url, body=jsonPayload)
+        request = self._requestWithRetry if method in RETRY_METHODS else self._request
+        response = request(method, url, **kwargs)
 
         if not response.data:
             return {}
         
-        return json.loads(response.data)
+        return json_loads(response.data)
     
     def v0Request(self, req, deviceUID = None):
         url = f"{self.host}/req?app={self._project_uid}&device={deviceUID if not deviceUID==None else ''}"
@@ -195,7 +387,7 @@ class NotehubClientService:
         if not response.data:
             return {}
         
-        return json.loads(response.data)
+        return json_loads(response.data)
 
 
 class NotehubProject:
@@ -219,16 +411,35 @@ class NotehubProject:
             if isinstance(deviceUID, str):
                 return self._client.v1Request(f"devices/{deviceUID}")
             
-            return [self._client.v1Request(f"devices/{d}") for d in deviceUID]
+            # Each device is a separate round trip, so fetch them concurrently
+            return list(executor.map(lambda d: self._client.v1Request(f"devices/{d}"), deviceUID))
         
 
-        hasMore = True
-        devices = []
         pageSize = 500
-        pageNumber = 1
+        r = self._client.v1Request("devices", params={"pageNum": 1, "pageSize": pageSize})
+        # The parsed page list isn't shared, so build the result on it rather than copying it
+        devices = r["devices"]
+        hasMore = r.get("has_more", False)
+
+        # When Notehub reports the device count, the remaining pages are known up front
+        # and can be fetched concurrently rather than one after another
+        total = r.get("total")
+        pageNumber = 2
+        if hasMore and isinstance(total, int):
+            pageCount = -(-total // pageSize)
+            pages = list(executor.map(
+                lambda n: self._client.v1Request("devices", params={"pageNum": n, "pageSize": pageSize}),
+                range(2, pageCount + 1)))
+            devices.extend(chain.from_iterable(page["devices"] for page in pages))
+            # Devices added during the scan spill past the pages counted from total,
+            # so carry on from the last page one page at a time
+            if pages:
+                hasMore = pages[-1].get("has_more", False)
+            pageNumber = pageCount + 1
+
         while hasMore:
             r = self._client.v1Request("devices", params={"pageNum": pageNumber, "pageSize": pageSize})
-            devices += r["devices"]
+            devices.extend(r["devices"])
             hasMore = r.get("has_more", False)
             pageNumber += 1
 
@@ -281,7 +492,67 @@ class NotehubProject:
         if isinstance(deviceUID, str):
             return self._client.v1Request(f"devices/{deviceUID}/dfu/{firmwareType}/status")
         
-        raise(Exception("Device UID must be a string. Only accepts a single device UID. Arrays are not supported"))
+        if isinstance(deviceUID, (list, tuple)):
+            # One request per device, so fetch them concurrently. Results keep the order of deviceUID
+            return list(executor.map(lambda d: self.getDeviceFirmwareUpdateStatus(d, firmwareType), deviceUID))
+        
+        raise(Exception("Device UID must be a string or a list of strings"))
+
+    def getDeviceFirmwareUpdateStatusBulk(self, deviceUIDs, firmwareType):
+        """
+        Get the firmware update status for many devices using the project level DFU status endpoint.
+        
+        Devices are requested in groups of DFU_STATUS_BULK_CHUNK_SIZE, so a fleet takes one
+        request per group rather than one per device. Groups are fetched concurrently.
+        
+        Args:
+            deviceUIDs (list): Device UIDs to get the status of
+            firmwareType (str): FirmwareType.Notecard or FirmwareType.Host
+            
+        Returns:
+            dict: Update status keyed by device UID. Devices Notehub doesn't report are omitted
+        """
+        if isinstance(deviceUIDs, str) or not all(isinstance(d, str) for d in deviceUIDs):
+            raise(Exception("Device UIDs must be a list of strings"))
+
+        deviceUIDs = list(deviceUIDs)
+        chunks = [deviceUIDs[i:i + DFU_STATUS_BULK_CHUNK_SIZE] for i in range(0, len(deviceUIDs), DFU_STATUS_BULK_CHUNK_SIZE)]
+
+        def fetchChunk(chunk):
+            statuses = []
+            pageNumber = 1
+            hasMore = True
+            while hasMore:
+                r = self._client.v1Request(f"dfu/{firmwareType}/status",
+                                           params={"deviceUID": chunk, "pageNum": pageNumber, "pageSize": len(chunk)})
+                statuses += r.get("devices") or []
+                hasMore = r.get("has_more", False)
+                pageNumber += 1
+            return statuses
+
+        result = {}
+        for statuses in executor.map(fetchChunk, chunks):
+            for status in statuses:
+                result[status.get("device_uid")] = status
+
+        return result
+
+    def getDeviceFirmwareUpdateStatusAll(self, deviceUID):
+        """
+        Get the Notecard and Host firmware update status for a device.
+        
+        Notehub reports DFU status per firmware type, so both requests are issued concurrently.
+        
+        Returns:
+            dict: Update status keyed by FirmwareType.Notecard and FirmwareType.Host
+        """
+        if not isinstance(deviceUID, str):
+            raise(Exception("Device UID must be a string. Only accepts a single device UID. Arrays are not supported"))
+
+        notecardStatus = executor.submit(self.getDeviceFirmwareUpdateStatus, deviceUID, FirmwareType.Notecard)
+        hostStatus = self.getDeviceFirmwareUpdateStatus(deviceUID, FirmwareType.Host)
+
+        return {FirmwareType.Notecard: notecardStatus.result(), FirmwareType.Host: hostStatus}
 
     def requestDeviceFirmwareUpdate(self, deviceUID, fileName, firmwareType):
         
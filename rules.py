@@ -1,12 +1,21 @@
-DEFAULT_RULES = [{"id":"default",
-                  "conditions":None,
-                  "target_versions": None}]
+from functools import lru_cache
+
+# Re-exported so rule sets are defined against the same default the rules engine uses
+from rules_engine import DEFAULT_RULES
+
+@lru_cache(maxsize=1024)
+def parseVersion(s):
+    """
+    Parse a version string such as "8.1.3.17044" into a tuple of integers.
+    Fleets share a handful of versions, so parsed versions are cached.
+    """
+    return tuple(int(x) for x in s.split("."))
 
 def majorVersion(s):
-    return int(s.split(".")[0])
+    return parseVersion(s)[0]
 
 def minorVersion(s):
-    return int(s.split(".")[1])
+    return parseVersion(s)[1]
 
 def fleetsContain(f):
     return lambda fleet_list: fleet_list and f in fleet_list
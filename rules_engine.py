@@ -8,11 +8,304 @@ The rules engine is independent of external dependencies like Notehub APIs,
 making it easily testable and reusable.
 """
 
+from functools import partial
+from operator import eq, is_, methodcaller
+
 # Default rule set that accepts any configuration but doesn't request updates
 DEFAULT_RULES = [{"id": "default", "conditions": None, "target_versions": None}]
 
+# Compiled rule sets keyed by id() of the rules object they were compiled from and the match order.
+# The rules object is stored with its compiled form so its id() can't be reused while cached,
+# along with the rules it held, so rules added, removed or replaced in the list are noticed.
+_compiled_rules_cache = {}
+_COMPILED_RULES_CACHE_SIZE = 32
+
+# Maximum number of evaluation results remembered within one getFirmwareUpdateTargetsBatch call
+_RULE_RESULTS_CACHE_SIZE = 1024
+
+# Orders in which rules can be matched. "first" gives precedence to earlier rules,
+# "last" to later rules, for rule sets where specific rules override general ones
+MATCH_ORDERS = ("first", "last")
+
+# Rule sets with fewer rules than this are scanned in order rather than indexed
+_RULE_INDEX_MIN_RULES = 8
+
+
+def _equals(expected):
+    """Build a predicate that checks a device value for an exact match."""
+    # partial(eq, ...) is evaluated in C, avoiding a Python frame per check
+    return partial(eq, expected)
+
+
+def compile_rules(rules):
+    """
+    Compile a rule set into a flat form that is cheap to evaluate repeatedly.
+    
+    Each rule is resolved once into a (rule_id, target_versions, checks) tuple, where
+    checks is a tuple of (field_name, predicate) pairs. Callable conditions are used
+    as-is and any other condition value becomes an exact match predicate. Exact match
+    predicates come first in checks, followed by the callables in their original order.
+    
+    Args:
+        rules (list or dict): Rule set in the format accepted by getFirmwareUpdateTargets
+        
+    Returns:
+        tuple: Compiled rules in evaluation order
+    """
+    # Normalize rules to list format
+    if not isinstance(rules, list):
+        rules = [rules]
+
+    compiled = []
+    for i, rule in enumerate(rules):
+        conditions = rule.get("conditions", None)
+        checks = ()
+        if conditions is not None:
+            # Exact matches are cheap, so check them before callables, which may do arbitrary work.
+            # Callables keep their order, so one never runs where it wouldn't have before
+            exact = [(field_name, _equals(condition)) for field_name, condition in conditions.items() if not callable(condition)]
+            calls = [(field_name, condition) for field_name, condition in conditions.items() if callable(condition)]
+            checks = tuple(exact + calls)
+        rule_id = rule["id"] if "id" in rule else f"rule-{i + 1}"
+        compiled.append((rule_id, rule.get("target_versions", None), checks))
+
+    return tuple(compiled)
+
+
+def _equalsConstant(check):
+    """Return (True, value) if check is an exact match predicate on a hashable value, otherwise (False, None)."""
+    if isinstance(check, partial) and check.func is eq and len(check.args) == 1 and not check.keywords:
+        try:
+            hash(check.args[0])
+            return True, check.args[0]
+        except TypeError:
+            pass
+    return False, None
+
+
+def _buildRuleIndex(compiled):
+    """
+    Index a compiled rule set by the field most rules match exactly.
+    
+    Returns:
+        tuple: (field name, candidate rules keyed by value, candidate rules for any other value),
+               or None if no field is worth indexing. Candidates keep their original order,
+               so the first matching candidate is the first matching rule
+    """
+    if len(compiled) < _RULE_INDEX_MIN_RULES:
+        return None
+
+    counts = {}
+    for _, _, checks in compiled:
+        for field_name, check in checks:
+            if _equalsConstant(check)[0]:
+                counts[field_name] = counts.get(field_name, 0) + 1
+    if not counts:
+        return None
+    field = max(counts, key=counts.get)
+    if counts[field] < 2:
+        return None
+
+    # Rules that don't match the field exactly are candidates for every value
+    keyed = {}
+    fallback = []
+    for position, (_, _, checks) in enumerate(compiled):
+        isConstant, value = _equalsConstant(dict(checks).get(field))
+        if isConstant:
+            keyed.setdefault(value, []).append(position)
+        else:
+            fallback.append(position)
+
+    buckets = {value: tuple(compiled[i] for i in sorted(positions + fallback)) for value, positions in keyed.items()}
+    return (field, buckets, tuple(compiled[i] for i in fallback))
+
+
+def _getCompiledRules(rules, match_order="first"):
+    """
+    Return the compiled form of a rule set, compiling it on first use.
+    
+    A rules list is compiled again when rules are added to, removed from or replaced in
+    it. Changes made inside a rule that has already been evaluated are not detected, so
+    replace the rule rather than editing it. Each match order is compiled separately,
+    with the rules in the order they are evaluated.
+    
+    Returns:
+        tuple: (compiled rules, (field name, value getter) for each field the conditions use,
+                result when it doesn't depend on the device or None, rule index or None)
+    """
+    cacheKey = (id(rules), match_order)
+    entry = _compiled_rules_cache.get(cacheKey)
+    if entry is not None and entry[0] is rules:
+        cachedRules = entry[1]
+        # Comparing identities is cheap next to compiling, and catches in-place list edits
+        if cachedRules is None or (len(cachedRules) == len(rules) and all(map(is_, cachedRules, rules))):
+            return entry[2]
+
+    if match_order not in MATCH_ORDERS:
+        raise(Exception(f"match_order must be one of {MATCH_ORDERS}"))
+
+    # Rule IDs are assigned by list position before the order is reversed
+    compiled = compile_rules(rules)
+    if match_order == "last":
+        compiled = compiled[::-1]
+
+    # A rule without conditions always matches, so rules after it can never be reached
+    for i, (_, _, checks) in enumerate(compiled):
+        if not checks:
+            compiled = compiled[:i + 1]
+            break
+
+    fieldNames = dict.fromkeys(field_name for _, _, checks in compiled for field_name, _ in checks)
+    # Field accessors are built once here rather than parsing field names each time a device is evaluated
+    fields = tuple((field_name, _fieldGetter(field_name)) for field_name in fieldNames)
+
+    # Without any conditions to check, such as with DEFAULT_RULES, every device gets the same result
+    constant = None
+    if not fields:
+        constant = compiled[0][:2] if compiled else (None, None)
+
+    ruleSet = (compiled, fields, constant, _buildRuleIndex(compiled))
+
+    if cacheKey not in _compiled_rules_cache and len(_compiled_rules_cache) >= _COMPILED_RULES_CACHE_SIZE:
+        _compiled_rules_cache.pop(next(iter(_compiled_rules_cache)), None)
+    _compiled_rules_cache[cacheKey] = (rules, tuple(rules) if isinstance(rules, list) else None, ruleSet)
+    return ruleSet
+
+
+def _resultKey(value):
+    """
+    Build a hashable key for a device field value. Raises TypeError if there isn't one.
+    
+    The type is part of the key so values that compare equal across types, such as
+    1 and True, are not treated as the same input to a callable condition.
+    """
+    if isinstance(value, (list, tuple)):
+        return (type(value), tuple(_resultKey(v) for v in value))
+    
+    hash(value)
+    return (type(value), value)
+
+
+def _splitPath(field_name):
+    """Split a dot notation field name into its first part and a tuple of the remaining parts."""
+    first, *rest = field_name.split('.')
+    return (first, tuple(rest))
+
+
+def _resolvePath(device_data, path):
+    """
+    Resolve a dot notation field, as split by _splitPath, from device_data.
+    
+    Args:
+        device_data (dict): Device field values
+        path (tuple): (first part, remaining parts), e.g. ("firmware_notecard", ("version",))
+                      for "firmware_notecard.version"
+        
+    Returns:
+        The resolved field value, or None if the field path cannot be found
+        
+    Examples:
+        _resolvePath(device_data, ("firmware_notecard", ("version",))) -> device_data["firmware_notecard"]["version"]
+        _resolvePath(device_data, ("missing", ("field",))) -> None
+    """
+    first, rest = path
+    current_value = device_data.get(first)
+    
+    # Navigate through the nested structure. A missing field or a value that isn't
+    # a dict (including None) ends the traversal
+    for part in rest:
+        if not isinstance(current_value, dict):
+            return None
+        current_value = current_value.get(part)
+            
+    return current_value
+
+
+def _fieldGetter(field_name):
+    """
+    Build a function that resolves a field, which may use dot notation, from device data.
+    
+    Flat fields and fields nested one level deep, the common cases, get dedicated
+    getters. Deeper paths are traversed by _resolvePath.
+    """
+    if '.' not in field_name:
+        # Evaluated in C, without a Python frame
+        return methodcaller('get', field_name)
+    
+    path = _splitPath(field_name)
+    first, rest = path
+    if len(rest) == 1:
+        second = rest[0]
+        
+        def getNested(device_data):
+            value = device_data.get(first)
+            return value.get(second) if isinstance(value, dict) else None
+        return getNested
+    
+    return partial(_resolvePath, path=path)
 
-def getFirmwareUpdateTargets(device_data, rules=DEFAULT_RULES):
+
+def _evaluateCompiledRules(ruleSet, device_data, results=None):
+    """
+    Evaluate a compiled rule set, as returned by _getCompiledRules, against one device.
+    
+    Args:
+        results (dict, optional): Outcomes already evaluated, keyed by the values of the
+            fields the conditions use. Only pass this when the callable conditions depend
+            solely on the value they are given
+    
+    Returns:
+        tuple: (rule_id, target_versions), or (None, None) if no rule matches
+    """
+    compiled, fields, constant, index = ruleSet
+    if constant is not None:
+        return constant
+
+    values = {field_name: getValue(device_data) for field_name, getValue in fields}
+    key = None
+    if results is not None:
+        # Many devices share the same values, so reuse the outcome for each set of values
+        try:
+            key = tuple(_resultKey(value) for value in values.values())
+        except TypeError:
+            pass  # A value can't be hashed, so evaluate without caching
+
+    if key is not None:
+        result = results.get(key)
+        if result is not None:
+            return result
+
+    result = (None, None)
+
+    # Large rule sets only need the rules that could match the device's value of the indexed field
+    candidates = compiled
+    if index is not None:
+        field, buckets, fallback = index
+        try:
+            candidates = buckets.get(values[field], fallback)
+        except TypeError:
+            pass  # The value can't be hashed, so check every rule
+
+    # Evaluate each rule in order
+    for rule_id, target_versions, checks in candidates:
+        # Check all conditions must be met (iterate over arbitrary fields)
+        for field_name, check in checks:
+            if not check(values[field_name]):
+                break
+        else:
+            # All conditions match, return this rule's targets
+            result = (rule_id, target_versions)
+            break
+
+    if key is not None:
+        if len(results) >= _RULE_RESULTS_CACHE_SIZE:
+            results.clear()
+        results[key] = result
+
+    return result
+
+
+def getFirmwareUpdateTargets(device_data, rules=DEFAULT_RULES, match_order="first"):
     """
     Determine firmware update targets based on device conditions and rules.
     
@@ -22,6 +315,8 @@ def getFirmwareUpdateTargets(device_data, rules=DEFAULT_RULES):
     Args:
         device_data (dict): Dictionary containing device field values for rule evaluation
         rules (list or dict): Rule set to evaluate against device conditions
+        match_order (str): "first" (default) to give precedence to the first matching rule,
+            or "last" to give precedence to the last matching rule
         
     Returns:
         tuple: (rule_id, target_versions)
@@ -40,11 +335,19 @@ def getFirmwareUpdateTargets(device_data, rules=DEFAULT_RULES):
             - Can be None (no updates), string, or dict with firmware type keys
             
     Notes:
-        - Rules are evaluated in order, first match wins (precedence by list position)
+        - Rules are evaluated in order, first match wins (precedence by list position).
+          With match_order="last" rules are evaluated in reverse order, so the last match wins
         - If condition is None or missing, it's considered always true
         - If condition is callable, it's called with the device value
         - If condition is string, it must match exactly
+        - Exact match conditions are checked before callable conditions, so a callable
+          isn't called for a device that an exact match condition already rules out
         - If all conditions in a rule match, that rule's target_versions are returned
+        - Rule sets are compiled on first use and cached. Adding, removing or replacing
+          rules in the list is detected, but editing a rule in place after it has been
+          evaluated is not, so replace the rule instead
+        - Each call evaluates the conditions afresh, so callable conditions may depend on
+          more than the value they are given, such as the time of day
         
     Example:
         device_data = {
@@ -68,92 +371,34 @@ def getFirmwareUpdateTargets(device_data, rules=DEFAULT_RULES):
             }
         ]
     """
-    
-    def resolve_field_value(field_name):
-        """
-        Resolve field value from device_data, supporting dot notation for nested objects.
-        
-        Args:
-            field_name (str): Field name, potentially with dot notation (e.g., "firmware_notecard.version")
-            
-        Returns:
-            The resolved field value, or None if the field path cannot be found
-            
-        Examples:
-            resolve_field_value("fleet") -> device_data["fleet"]
-            resolve_field_value("firmware_notecard.version") -> device_data["firmware_notecard"]["version"]
-            resolve_field_value("missing.field") -> None
-        """
-        if '.' not in field_name:
-            # Simple field lookup
-            return device_data.get(field_name)
-        
-        # Dot notation - traverse nested object
-        parts = field_name.split('.')
-        current_value = device_data.get(parts[0])
-        
-        if current_value is None:
-            return None
-            
-        # Navigate through the nested structure
-        for part in parts[1:]:
-            if not isinstance(current_value, dict):
-                return None  # Can't traverse further - not a dict
-            current_value = current_value.get(part)
-            if current_value is None:
-                return None  # Field not found in nested structure
-                
-        return current_value
-
-    def match_condition(value, condition):
-        """
-        Check if a device value matches a rule condition.
-        
-        Args:
-            value: The device value to check
-            condition: The rule condition (string, or callable)
-            
-        Returns:
-            bool: True if condition matches, False otherwise
-        """
-        
-        if callable(condition):
-            # Function condition - call with device value
-            return condition(value)
-        
-        # String condition - exact match required
-        return value == condition
-    
-    def checkConditions(conditions):
-        if conditions is None:
-            return True
-        
-        for field_name, condition_value in conditions.items():
-            device_field_value = resolve_field_value(field_name)
-            if not match_condition(device_field_value, condition_value):
-                return False
-            
-        return True
+    return _evaluateCompiledRules(_getCompiledRules(rules, match_order), device_data)
 
-    # Normalize rules to list format
-    if not isinstance(rules, list):
-        rules = [rules]
 
-    # Evaluate each rule in order
-    for i, rule in enumerate(rules):
-        conditions = rule.get("conditions", None)
-        rule_id = rule.get("id", f"rule-{i + 1}")
-        target_versions = rule.get("target_versions", None)
+def getFirmwareUpdateTargetsBatch(devices, rules=DEFAULT_RULES, match_order="first"):
+    """
+    Determine firmware update targets for many devices against the same rule set.
+    
+    Equivalent to calling getFirmwareUpdateTargets for each device, but the rule set
+    is looked up once for the whole batch, and devices that share the values of the
+    fields the conditions use are only evaluated once. Callable conditions must
+    therefore only depend on the value they are given. Use getFirmwareUpdateTargets
+    for rules with conditions that don't, such as time windows or percentage rollouts.
+    
+    Args:
+        devices (iterable): Device data dictionaries, as accepted by getFirmwareUpdateTargets
+        rules (list or dict): Rule set to evaluate against device conditions
+        match_order (str): "first" or "last", as for getFirmwareUpdateTargets
         
-        # Check all conditions must be met (iterate over arbitrary fields)
-        all_conditions_match = checkConditions(conditions)
+    Returns:
+        list: (rule_id, target_versions) tuples in the same order as devices
+    """
+    ruleSet = _getCompiledRules(rules, match_order)
+    results = {}
+    return [_evaluateCompiledRules(ruleSet, device_data, results) for device_data in devices]
 
-        # If all conditions match, return this rule's targets
-        if all_conditions_match:
-            return (rule_id, target_versions)
 
-    # No rules matched
-    return (None, None)
+# Compile the default rule set up front, so the first evaluation with it doesn't pay for compiling
+_getCompiledRules(DEFAULT_RULES)
 
 
 #MIT License
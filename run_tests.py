@@ -6,6 +6,7 @@ This script runs all unit tests and optionally collects coverage data.
 Usage:
     python run_tests.py          # Run tests without coverage
     python run_tests.py --coverage   # Run tests with coverage report
+    python run_tests.py --failfast   # Stop on the first failing test
 """
 
 import sys
@@ -15,12 +16,20 @@ import argparse
 from pathlib import Path
 
 
-def install_coverage_if_needed():
-    """Install coverage package if it's not available and coverage is requested."""
+def install_coverage_if_needed(auto_install=False):
+    """
+    Check the coverage package is available, installing it only if auto_install is set.
+    Installing needs network access and can take several seconds, so it is opt-in.
+    """
     try:
         import coverage
         return True
     except ImportError:
+        if not auto_install:
+            print("ERROR: Coverage package not found.")
+            print("Please install it (pip install coverage) or rerun with --auto-install-coverage")
+            return False
+        
         print("Coverage package not found. Installing...")
         import subprocess
         try:
@@ -33,9 +42,19 @@ def install_coverage_if_needed():
             return False
 
 
-def run_tests_with_coverage():
+def run_test_suite(failfast=False):
+    """Discover the tests in the tests directory and run them."""
+    loader = unittest.TestLoader()
+    start_dir = os.path.join(os.path.dirname(__file__), 'tests')
+    suite = loader.discover(start_dir, pattern='test_*.py')
+    
+    runner = unittest.TextTestRunner(verbosity=2, failfast=failfast)
+    return runner.run(suite)
+
+
+def run_tests_with_coverage(failfast=False, auto_install=False):
     """Run tests with coverage collection."""
-    if not install_coverage_if_needed():
+    if not install_coverage_if_needed(auto_install):
         return False
     
     import coverage
@@ -52,12 +71,7 @@ def run_tests_with_coverage():
     cov.start()
     
     # Run the tests
-    loader = unittest.TestLoader()
-    start_dir = os.path.join(os.path.dirname(__file__), 'tests')
-    suite = loader.discover(start_dir, pattern='test_*.py')
-    
-    runner = unittest.TextTestRunner(verbosity=2)
-    result = runner.run(suite)
+    result = run_test_suite(failfast)
     
     # Stop coverage and generate report
     cov.stop()
@@ -89,16 +103,9 @@ def run_tests_with_coverage():
     return result.wasSuccessful()
 
 
-def run_tests_without_coverage():
+def run_tests_without_coverage(failfast=False):
     """Run tests without coverage collection."""
-    loader = unittest.TestLoader()
-    start_dir = os.path.join(os.path.dirname(__file__), 'tests')
-    suite = loader.discover(start_dir, pattern='test_*.py')
-    
-    runner = unittest.TextTestRunner(verbosity=2)
-    result = runner.run(suite)
-    
-    return result.wasSuccessful()
+    return run_test_suite(failfast).wasSuccessful()
 
 
 def main():
@@ -114,12 +121,23 @@ def main():
         action='store_true',
         help='Verbose output (equivalent to unittest -v)'
     )
+    parser.add_argument(
+        '--auto-install-coverage',
+        action='store_true',
+        help='Install the coverage package with pip if it is missing'
+    )
+    parser.add_argument(
+        '--failfast', '-x',
+        action='store_true',
+        help='Stop on the first failing test'
+    )
     
     args = parser.parse_args()
     
     # Change to the script's directory to ensure proper imports
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    os.chdir(script_dir)
+    if os.getcwd() != script_dir:
+        os.chdir(script_dir)
     
     # Add current directory to Python path
     if script_dir not in sys.path:
@@ -129,9 +147,9 @@ def main():
     print("="*50)
     
     if args.coverage:
-        success = run_tests_with_coverage()
+        success = run_tests_with_coverage(args.failfast, args.auto_install_coverage)
     else:
-        success = run_tests_without_coverage()
+        success = run_tests_without_coverage(args.failfast)
     
     if success:
         print("\n✅ All tests passed!")
@@ -8,6 +8,7 @@ This test suite validates the main module functionality including:
 """
 
 import unittest
+from unittest.mock import patch
 import json
 import sys
 import os
@@ -18,6 +19,19 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import main
 
 
+# Values parse_firmware_json should return unchanged
+NOT_JSON_OBJECTS = (
+    "just a regular string",
+    '{"version": "8.1.3", "built":}',   # Invalid JSON
+    '["version", "8.1.3"]',             # JSON array
+    '"just a string"',                  # JSON string
+    '',
+    '  {"version": "8.1.3"',            # Unclosed object
+    None,
+    123
+)
+
+
 class TestJsonParsing(unittest.TestCase):
     """Test cases for JSON parsing functionality."""
     
@@ -39,32 +53,21 @@ class TestJsonParsing(unittest.TestCase):
         self.assertEqual(result, dict_input)
         self.assertIs(result, dict_input)  # Should be the same object
     
-    def test_parse_firmware_json_with_non_json_string(self):
-        """Test that non-JSON string is returned unchanged."""
-        non_json_string = "just a regular string"
-        
-        result = main.parse_firmware_json(non_json_string)
-        
-        self.assertEqual(result, non_json_string)
-    
-    def test_parse_firmware_json_with_invalid_json(self):
-        """Test that invalid JSON string is returned unchanged."""
-        invalid_json = '{"version": "8.1.3", "built":}'
-        
-        result = main.parse_firmware_json(invalid_json)
-        
-        self.assertEqual(result, invalid_json)
+    def test_parse_firmware_json_returns_other_values_unchanged(self):
+        """Test that values that aren't JSON objects are returned unchanged."""
+        for value in NOT_JSON_OBJECTS:
+            with self.subTest(value=value):
+                self.assertEqual(main.parse_firmware_json(value), value)
     
-    def test_parse_firmware_json_with_non_object_json(self):
-        """Test that non-object JSON (array, string) is returned unchanged."""
-        array_json = '["version", "8.1.3"]'
-        string_json = '"just a string"'
-        
-        result_array = main.parse_firmware_json(array_json)
-        result_string = main.parse_firmware_json(string_json)
-        
-        self.assertEqual(result_array, array_json)
-        self.assertEqual(result_string, string_json)
+    def test_parse_firmware_json_rejects_without_parsing(self):
+        """Test that values that can't be a JSON object are rejected without invoking the parser."""
+        for value in NOT_JSON_OBJECTS:
+            if isinstance(value, str) and value.strip()[:1] == '{':
+                continue  # Only the parser can tell these apart
+            with self.subTest(value=value):
+                with patch('main.json_loads') as mock_loads:
+                    main.parse_firmware_json(value)
+                mock_loads.assert_not_called()
     
     def test_parse_firmware_json_with_whitespace(self):
         """Test JSON parsing with surrounding whitespace."""
@@ -75,56 +78,63 @@ class TestJsonParsing(unittest.TestCase):
         
         self.assertEqual(result, expected)
     
-    def test_parse_firmware_json_with_none(self):
-        """Test that None input is returned unchanged."""
-        result = main.parse_firmware_json(None)
-        self.assertIsNone(result)
+    def test_parse_firmware_json_with_trailing_whitespace(self):
+        """Test JSON parsing when only trailing whitespace is present."""
+        result = main.parse_firmware_json('{"version": "8.1.3"}\n')
+        
+        self.assertEqual(result, {"version": "8.1.3"})
+    
+    def test_parse_firmware_json_with_empty_object(self):
+        """Test that empty JSON objects are parsed."""
+        for value in ('{}', ' { } '):
+            with self.subTest(value=value):
+                self.assertEqual(main.parse_firmware_json(value), {})
     
-    def test_parse_firmware_json_with_number(self):
-        """Test that number input is returned unchanged."""
-        number_input = 123
-        result = main.parse_firmware_json(number_input)
-        self.assertEqual(result, number_input)
+    def test_parse_firmware_json_with_unquoted_keys(self):
+        """Test that objects with unquoted keys are returned unchanged without invoking the parser."""
+        value = '{version: 8.1.3}'
+        
+        with patch('main.json_loads') as mock_loads:
+            result = main.parse_firmware_json(value)
+        
+        self.assertEqual(result, value)
+        mock_loads.assert_not_called()
+
+
+# Request payload with JSON string firmware fields, and the same payload once parsed.
+# The parser works in place, so tests parse a copy
+_PAYLOAD_JSON_STRS = {
+    "device": "dev:123456",
+    "fleets": ["fleet:abc"],
+    "firmware_notecard": '{"version": "8.1.3", "built": "2024-01-15"}',
+    "firmware_host": '{"version": "3.1.2", "type": "production"}'
+}
+_PAYLOAD_PARSED = {
+    "device": "dev:123456",
+    "fleets": ["fleet:abc"],
+    "firmware_notecard": {"version": "8.1.3", "built": "2024-01-15"},
+    "firmware_host": {"version": "3.1.2", "type": "production"}
+}
 
 
 class TestParseFirmwareFields(unittest.TestCase):
-    """Test cases for parse_firmware_fields function."""
+    """Test cases for parse_firmware_fields_inplace function."""
     
     def test_parse_firmware_fields_with_json_strings(self):
         """Test parsing payload with JSON string firmware fields."""
-        payload = {
-            "device": "dev:123456",
-            "fleets": ["fleet:abc"],
-            "firmware_notecard": '{"version": "8.1.3", "built": "2024-01-15"}',
-            "firmware_host": '{"version": "3.1.2", "type": "production"}'
-        }
-        
-        result = main.parse_firmware_fields(payload)
+        payload = _PAYLOAD_JSON_STRS.copy()
         
-        expected = {
-            "device": "dev:123456",
-            "fleets": ["fleet:abc"],
-            "firmware_notecard": {"version": "8.1.3", "built": "2024-01-15"},
-            "firmware_host": {"version": "3.1.2", "type": "production"}
-        }
+        result = main.parse_firmware_fields_inplace(payload)
         
-        self.assertEqual(result, expected)
-        # Ensure original payload is not modified
-        self.assertIsInstance(payload["firmware_notecard"], str)
-        self.assertIsInstance(payload["firmware_host"], str)
+        self.assertEqual(result, _PAYLOAD_PARSED)
     
     def test_parse_firmware_fields_with_dict_firmware(self):
         """Test parsing payload with dict firmware fields (no change needed)."""
-        payload = {
-            "device": "dev:123456",
-            "fleets": ["fleet:abc"],
-            "firmware_notecard": {"version": "8.1.3", "built": "2024-01-15"},
-            "firmware_host": {"version": "3.1.2", "type": "production"}
-        }
+        payload = _PAYLOAD_PARSED.copy()
         
-        result = main.parse_firmware_fields(payload)
+        result = main.parse_firmware_fields_inplace(payload)
         
-        self.assertEqual(result, payload)
+        self.assertEqual(result, _PAYLOAD_PARSED)
     
     def test_parse_firmware_fields_with_mixed_types(self):
         """Test parsing with one JSON string and one dict."""
@@ -134,7 +144,7 @@ class TestParseFirmwareFields(unittest.TestCase):
             "firmware_host": {"version": "3.1.2"}
         }
         
-        result = main.parse_firmware_fields(payload)
+        result = main.parse_firmware_fields_inplace(payload)
         
         expected = {
             "device": "dev:123456", 
@@ -151,7 +161,7 @@ class TestParseFirmwareFields(unittest.TestCase):
             "fleets": ["fleet:abc"]
         }
         
-        result = main.parse_firmware_fields(payload)
+        result = main.parse_firmware_fields_inplace(payload)
         
         self.assertEqual(result, payload)
     
@@ -163,7 +173,7 @@ class TestParseFirmwareFields(unittest.TestCase):
             "firmware_host": '{"version": "3.1.2"}'
         }
         
-        result = main.parse_firmware_fields(payload)
+        result = main.parse_firmware_fields_inplace(payload)
         
         expected = {
             "device": "dev:123456",
@@ -173,21 +183,17 @@ class TestParseFirmwareFields(unittest.TestCase):
         
         self.assertEqual(result, expected)
     
-    def test_parse_firmware_fields_preserves_original(self):
-        """Test that the original payload is not modified."""
-        original_payload = {
+    def test_parse_firmware_fields_modifies_payload_in_place(self):
+        """Test that the payload is parsed in place rather than copied."""
+        payload = {
             "device": "dev:123456",
             "firmware_notecard": '{"version": "8.1.3"}'
         }
-        payload = original_payload.copy()
         
-        result = main.parse_firmware_fields(payload)
+        result = main.parse_firmware_fields_inplace(payload)
         
-        # Original payload should be unchanged
-        self.assertEqual(payload, original_payload)
-        # Result should be different
-        self.assertNotEqual(result, original_payload)
-        self.assertIsInstance(result["firmware_notecard"], dict)
+        self.assertIs(result, payload)
+        self.assertEqual(payload["firmware_notecard"], {"version": "8.1.3"})
 
 
 class TestStrToBool(unittest.TestCase):
@@ -218,6 +224,127 @@ class TestStrToBool(unittest.TestCase):
         self.assertFalse(main.str_to_bool(0))  # str(0) == "0" -> False
         self.assertTrue(main.str_to_bool(1))   # str(1) == "1" -> True
         self.assertFalse(main.str_to_bool(2))  # str(2) == "2" -> False
+        self.assertTrue(main.str_to_bool(True))   # str(True) == "True" -> True
+        self.assertFalse(main.str_to_bool(False))
+
+
+
+class TestProcessRoutedSession(unittest.TestCase):
+    """Test cases for processRoutedSession function."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        main.connectToNotehubProject.cache_clear()
+        self.addCleanup(main.connectToNotehubProject.cache_clear)
+    
+    @patch.multiple('manage_firmware',
+        _PROJECT_UID='test_project_uid',
+        _NOTEHUB_CLIENT_ID='test_client_id',
+        _NOTEHUB_CLIENT_SECRET='test_client_secret'
+    )
+    @patch('main.manageFirmware', return_value="No rule conditions met. No updates required")
+    @patch('manage_firmware.NotehubProject')
+    def test_project_is_reused_across_invocations(self, mock_notehub_project, mock_manage_firmware):
+        """Test that the Notehub project is only created once across invocations."""
+        main.processRoutedSession("dev:123456", {"device": "dev:123456"}, False)
+        main.processRoutedSession("dev:654321", {"device": "dev:654321"}, True)
+        
+        mock_notehub_project.assert_called_once()
+        project = mock_notehub_project.return_value
+        self.assertEqual(mock_manage_firmware.call_count, 2)
+        for call in mock_manage_firmware.call_args_list:
+            self.assertIs(call.args[0], project)
+
+
+class TestLambdaHandler(unittest.TestCase):
+    """Test cases for lambda_handler function."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        token_patcher = patch.object(main, '_EXPECTED_TOKEN', b'test_token_123')
+        token_patcher.start()
+        self.addCleanup(token_patcher.stop)
+        
+        session_patcher = patch('main.processRoutedSession', return_value="No rule conditions met. No updates required")
+        self.mock_process = session_patcher.start()
+        self.addCleanup(session_patcher.stop)
+    
+    def make_event(self, body, headers=None):
+        """Build an authenticated Lambda event."""
+        event_headers = {'Authorization': 'Bearer test_token_123'}
+        event_headers.update(headers or {})
+        return {'headers': event_headers, 'queryStringParameters': {}, 'body': body}
+    
+    def test_unauthorized_request(self):
+        """Test that requests with an invalid token are rejected."""
+        event = self.make_event({"device": "dev:123456"}, {'Authorization': 'Bearer wrong'})
+        
+        result = main.lambda_handler(event, None)
+        
+        self.assertEqual(result['statusCode'], 401)
+        self.mock_process.assert_not_called()
+    
+    def test_missing_device_uid(self):
+        """Test that requests without a device UID are rejected."""
+        result = main.lambda_handler(self.make_event({"fleets": []}), None)
+        
+        self.assertEqual(result['statusCode'], 400)
+        self.mock_process.assert_not_called()
+    
+    def test_success_response_omits_request_payload(self):
+        """Test that the request payload is not echoed back by default."""
+        result = main.lambda_handler(self.make_event('{"device": "dev:123456"}'), None)
+        
+        self.assertEqual(result['statusCode'], 200)
+        self.assertIsInstance(result['body'], str)
+        self.assertEqual(json.loads(result['body']), {"response": "No rule conditions met. No updates required"})
+        self.mock_process.assert_called_once_with("dev:123456", {"device": "dev:123456"}, False)
+    
+    def test_debug_echo_header_includes_request_payload(self):
+        """Test that the x-debug-echo header echoes the parsed request payload."""
+        body = {"device": "dev:123456", "firmware_notecard": '{"version": "8.1.3"}'}
+        event = self.make_event(body, {'x-debug-echo': 'true'})
+        
+        result = main.lambda_handler(event, None)
+        
+        self.assertEqual(json.loads(result['body']), {
+            "response": "No rule conditions met. No updates required",
+            "request_payload": {"device": "dev:123456", "firmware_notecard": {"version": "8.1.3"}}
+        })
+    
+    def test_dry_run_header(self):
+        """Test that the x-dry-run header enables dry-run mode."""
+        main.lambda_handler(self.make_event({"device": "dev:123456"}, {'x-dry-run': 'true'}), None)
+        
+        self.mock_process.assert_called_once_with("dev:123456", {"device": "dev:123456"}, True)
+    
+    def test_missing_query_string_parameters(self):
+        """Test that a None queryStringParameters value from API Gateway is handled."""
+        event = self.make_event({"device": "dev:123456"})
+        event['queryStringParameters'] = None
+        
+        result = main.lambda_handler(event, None)
+        
+        self.assertEqual(result['statusCode'], 200)
+        self.mock_process.assert_called_once_with("dev:123456", {"device": "dev:123456"}, False)
+    
+    def test_dry_run_query_string_parameter(self):
+        """Test that the is_dry_run query string parameter enables dry-run mode."""
+        event = self.make_event({"device": "dev:123456"})
+        event['queryStringParameters'] = {'is_dry_run': 'true'}
+        
+        main.lambda_handler(event, None)
+        
+        self.mock_process.assert_called_once_with("dev:123456", {"device": "dev:123456"}, True)
+    
+    def test_processing_error(self):
+        """Test that processing errors are returned as a 500 response."""
+        self.mock_process.side_effect = Exception("Notehub unavailable")
+        
+        result = main.lambda_handler(self.make_event({"device": "dev:123456"}), None)
+        
+        self.assertEqual(result['statusCode'], 500)
+        self.assertEqual(json.loads(result['body'])["error"], "Notehub unavailable")
 
 
 if __name__ == '__main__':
@@ -16,22 +16,34 @@ from unittest.mock import MagicMock, patch, call
 import sys
 import os
 import time
+import threading
 
 # Add the parent directory to the path so we can import modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import manage_firmware
 
+# DFU status for a device with no Notecard or Host update in progress
+NO_UPDATES_IN_PROGRESS = {
+    'notecard': {'dfu_in_progress': False},
+    'host': {'dfu_in_progress': False}
+}
+
 
 class TestConnectToNotehubProject(unittest.TestCase):
     """Test cases for connectToNotehubProject function."""
     
+    def setUp(self):
+        """Set up test fixtures."""
+        manage_firmware.connectToNotehubProject.cache_clear()
+        self.addCleanup(manage_firmware.connectToNotehubProject.cache_clear)
+    
     @patch('manage_firmware.NotehubProject')
-    @patch.dict(os.environ, {
-        'NOTEHUB_PROJECT_UID': 'test_project_uid',
-        'NOTEHUB_CLIENT_ID': 'test_client_id', 
-        'NOTEHUB_CLIENT_SECRET': 'test_client_secret'
-    })
+    @patch.multiple(manage_firmware,
+        _PROJECT_UID='test_project_uid',
+        _NOTEHUB_CLIENT_ID='test_client_id',
+        _NOTEHUB_CLIENT_SECRET='test_client_secret'
+    )
     def test_connect_with_environment_variables(self, mock_notehub_project):
         """Test successful connection using environment variables."""
         mock_project = MagicMock()
@@ -47,20 +59,27 @@ class TestConnectToNotehubProject(unittest.TestCase):
         self.assertEqual(result, mock_project)
 
     @patch('manage_firmware.NotehubProject')
-    @patch.dict(os.environ, {}, clear=True)
+    @patch.multiple(manage_firmware, _PROJECT_UID=None, _NOTEHUB_CLIENT_ID=None, _NOTEHUB_CLIENT_SECRET=None)
     def test_connect_with_missing_environment_variables(self, mock_notehub_project):
-        """Test connection with missing environment variables."""
-        mock_project = MagicMock()
-        mock_notehub_project.return_value = mock_project
-        
-        result = manage_firmware.connectToNotehubProject()
+        """Test that connecting fails before creating a project when environment variables are missing."""
+        with self.assertRaises(Exception) as context:
+            manage_firmware.connectToNotehubProject()
         
-        mock_notehub_project.assert_called_once_with(
-            project_uid=None,
-            client_id=None,
-            client_secret=None
-        )
-        self.assertEqual(result, mock_project)
+        self.assertIn("Notehub credentials not configured", str(context.exception))
+        mock_notehub_project.assert_not_called()
+
+    @patch('manage_firmware.NotehubProject')
+    @patch.multiple(manage_firmware,
+        _PROJECT_UID='test_project_uid',
+        _NOTEHUB_CLIENT_ID='test_client_id',
+        _NOTEHUB_CLIENT_SECRET=''
+    )
+    def test_connect_with_empty_environment_variable(self, mock_notehub_project):
+        """Test that an empty credential is treated as missing."""
+        with self.assertRaises(Exception):
+            manage_firmware.connectToNotehubProject()
+        
+        mock_notehub_project.assert_not_called()
 
 
 class TestFirmwareCache(unittest.TestCase):
@@ -79,7 +98,7 @@ class TestFirmwareCache(unittest.TestCase):
         self.assertEqual(cache._expiration_duration_seconds, 1800)
 
     @patch('manage_firmware.FirmwareType')
-    @patch('time.time')
+    @patch('time.monotonic')
     def test_update_success(self, mock_time, mock_firmware_type):
         """Test successful cache update."""
         mock_time.return_value = 1000
@@ -97,20 +116,16 @@ class TestFirmwareCache(unittest.TestCase):
         self.cache.update(self.mock_project)
         
         expected_cache = {
-            'notecard': {
-                '8.1.3': 'notecard-8.1.3.bin',
-                '8.1.4': 'notecard-8.1.4.bin'
-            },
-            'host': {
-                '3.1.2': 'host-3.1.2.bin'
-            }
+            ('notecard', '8.1.3'): 'notecard-8.1.3.bin',
+            ('notecard', '8.1.4'): 'notecard-8.1.4.bin',
+            ('host', '3.1.2'): 'host-3.1.2.bin'
         }
         self.assertEqual(self.cache.cache, expected_cache)
         self.assertEqual(self.cache.cache_expiry, 2800)  # 1000 + 1800
         self.mock_project.fetchAvailableFirmware.assert_called_once()
 
     @patch('manage_firmware.FirmwareType')
-    @patch('time.time')
+    @patch('time.monotonic')
     def test_update_with_incomplete_data(self, mock_time, mock_firmware_type):
         """Test cache update with incomplete firmware data."""
         mock_time.return_value = 1000
@@ -123,6 +138,7 @@ class TestFirmwareCache(unittest.TestCase):
             {'type': 'notecard', 'version': None, 'filename': 'invalid.bin'},  # Missing version
             {'type': None, 'version': '8.1.4', 'filename': 'invalid2.bin'},    # Missing type
             {'type': 'host', 'version': '3.1.2', 'filename': None},           # Missing filename
+            {'type': 'host', 'version': '3.1.3'},                             # Filename field absent
         ]
         self.mock_project.fetchAvailableFirmware.return_value = mock_firmware_data
         
@@ -130,19 +146,77 @@ class TestFirmwareCache(unittest.TestCase):
         
         # Only the valid entry should be cached
         expected_cache = {
-            'notecard': {'8.1.3': 'notecard-8.1.3.bin'},
-            'host': {}
+            ('notecard', '8.1.3'): 'notecard-8.1.3.bin'
         }
         self.assertEqual(self.cache.cache, expected_cache)
 
+    def test_update_ignores_unknown_firmware_types(self):
+        """Test that firmware of other types in the library does not break the cache update."""
+        self.mock_project.fetchAvailableFirmware.return_value = [
+            {'type': 'notecard', 'version': '8.1.3', 'filename': 'notecard-8.1.3.bin'},
+            {'type': 'modem', 'version': '1.0.0', 'filename': 'modem-1.0.0.bin'},
+        ]
+        
+        self.cache.update(self.mock_project)
+        
+        self.assertEqual(self.cache.retrieve(self.mock_project, 'notecard', '8.1.3'), 'notecard-8.1.3.bin')
+
+    @patch('time.monotonic')
+    def test_update_unchanged_catalog_reuses_cache(self, mock_time):
+        """Test that an unchanged firmware catalog does not rebuild the cache but extends its expiry."""
+        mock_firmware_data = [
+            {'type': 'notecard', 'version': '8.1.3', 'filename': 'notecard-8.1.3.bin'},
+            {'type': 'host', 'version': '3.1.2', 'filename': 'host-3.1.2.bin'},
+        ]
+        self.mock_project.fetchAvailableFirmware.return_value = mock_firmware_data
+        
+        mock_time.return_value = 1000
+        self.cache.update(self.mock_project)
+        first_cache = self.cache.cache
+        
+        mock_time.return_value = 5000
+        self.cache.update(self.mock_project)
+        
+        self.assertIs(self.cache.cache, first_cache)
+        self.assertEqual(self.cache.cache_expiry, 6800)  # 5000 + 1800
+
+    @patch('time.monotonic')
+    def test_update_changed_catalog_rebuilds_cache(self, mock_time):
+        """Test that a changed firmware catalog replaces the cached firmware."""
+        mock_time.return_value = 1000
+        self.mock_project.fetchAvailableFirmware.return_value = [
+            {'type': 'notecard', 'version': '8.1.3', 'filename': 'notecard-8.1.3.bin'},
+        ]
+        self.cache.update(self.mock_project)
+        
+        self.mock_project.fetchAvailableFirmware.return_value = [
+            {'type': 'notecard', 'version': '8.1.4', 'filename': 'notecard-8.1.4.bin'},
+        ]
+        self.cache.update(self.mock_project)
+        
+        self.assertEqual(self.cache.cache, {('notecard', '8.1.4'): 'notecard-8.1.4.bin'})
+
+    def test_update_unhashable_filename_reported_per_entry(self):
+        """Test that an unhashable filename only makes that firmware unavailable."""
+        self.mock_project.fetchAvailableFirmware.return_value = [
+            {'type': 'notecard', 'version': '8.1.3', 'filename': ['notecard-8.1.3.bin']},
+            {'type': 'host', 'version': '3.1.2', 'filename': 'host-3.1.2.bin'},
+        ]
+        
+        self.assertEqual(self.cache.retrieve(self.mock_project, 'host', '3.1.2'), 'host-3.1.2.bin')
+        with self.assertRaises(Exception) as context:
+            self.cache.retrieve(self.mock_project, 'notecard', '8.1.3')
+        
+        self.assertIn("Invalid firmware file name", str(context.exception))
+
     def test_retrieve_cache_hit(self):
         """Test successful cache retrieval."""
         # Pre-populate cache
         self.cache.cache = {
-            'notecard': {'8.1.3': 'notecard-8.1.3.bin'},
-            'host': {'3.1.2': 'host-3.1.2.bin'}
+            ('notecard', '8.1.3'): 'notecard-8.1.3.bin',
+            ('host', '3.1.2'): 'host-3.1.2.bin'
         }
-        self.cache.cache_expiry = time.time() + 1000  # Not expired
+        self.cache.cache_expiry = time.monotonic() + 1000  # Not expired
         
         result = self.cache.retrieve(self.mock_project, 'notecard', '8.1.3')
         
@@ -150,8 +224,8 @@ class TestFirmwareCache(unittest.TestCase):
 
     def test_retrieve_cache_miss_firmware_type(self):
         """Test cache retrieval with missing firmware type."""
-        self.cache.cache = {'notecard': {'8.1.3': 'notecard-8.1.3.bin'}}
-        self.cache.cache_expiry = time.time() + 1000
+        self.cache.cache = {('notecard', '8.1.3'): 'notecard-8.1.3.bin'}
+        self.cache.cache_expiry = time.monotonic() + 1000
         
         with self.assertRaises(Exception) as context:
             self.cache.retrieve(self.mock_project, 'missing_type', '8.1.3')
@@ -161,10 +235,9 @@ class TestFirmwareCache(unittest.TestCase):
     def test_retrieve_cache_miss_version(self):
         """Test cache retrieval with missing version."""
         self.cache.cache = {
-            'notecard': {'8.1.3': 'notecard-8.1.3.bin'},
-            'host': {}
+            ('notecard', '8.1.3'): 'notecard-8.1.3.bin'
         }
-        self.cache.cache_expiry = time.time() + 1000
+        self.cache.cache_expiry = time.monotonic() + 1000
         
         with self.assertRaises(Exception) as context:
             self.cache.retrieve(self.mock_project, 'notecard', '8.1.4')
@@ -174,28 +247,46 @@ class TestFirmwareCache(unittest.TestCase):
     def test_retrieve_invalid_filename(self):
         """Test cache retrieval with invalid filename."""
         self.cache.cache = {
-            'notecard': {'8.1.3': ''},  # Empty filename
-            'host': {'3.1.2': None}     # None filename  
+            ('notecard', '8.1.3'): '',  # Empty filename
+            ('host', '3.1.2'): None     # None filename  
         }
-        self.cache.cache_expiry = time.time() + 1000
+        self.cache.cache_expiry = time.monotonic() + 1000
         
         with self.assertRaises(Exception) as context:
             self.cache.retrieve(self.mock_project, 'notecard', '8.1.3')
         
         self.assertIn("Invalid firmware file name for version 8.1.3 for notecard", str(context.exception))
 
+    def test_try_retrieve_found(self):
+        """Test that try_retrieve returns the file name for a cached version."""
+        self.cache.cache = {('notecard', '8.1.3'): 'notecard-8.1.3.bin'}
+        self.cache.cache_expiry = time.monotonic() + 1000
+        
+        self.assertEqual(self.cache.try_retrieve(self.mock_project, 'notecard', '8.1.3'), (True, 'notecard-8.1.3.bin'))
+
+    def test_try_retrieve_missing_version(self):
+        """Test that try_retrieve reports a missing version without raising."""
+        self.cache.cache = {('notecard', '8.1.3'): 'notecard-8.1.3.bin'}
+        self.cache.cache_expiry = time.monotonic() + 1000
+        
+        found, reason = self.cache.try_retrieve(self.mock_project, 'notecard', '9.9.9')
+        
+        self.assertFalse(found)
+        self.assertIn("Firmware version 9.9.9 for notecard not available", reason)
+        self.assertIn("Available versions: 8.1.3", reason)
+
     @patch.object(manage_firmware.FirmwareCache, 'update')
     def test_retrieve_expired_cache_triggers_update(self, mock_update):
         """Test that expired cache triggers an update."""
-        self.cache.cache_expiry = time.time() - 1000  # Expired
+        self.cache.cache_expiry = time.monotonic() - 1000  # Expired
         self.cache.cache = {
-            'notecard': {'8.1.3': 'notecard-8.1.3.bin'}
+            ('notecard', '8.1.3'): 'notecard-8.1.3.bin'
         }
         
         # After mock update, set valid cache
         def side_effect(project):
-            self.cache.cache = {'notecard': {'8.1.3': 'notecard-8.1.3.bin'}}
-            self.cache.cache_expiry = time.time() + 1000
+            self.cache.cache = {('notecard', '8.1.3'): 'notecard-8.1.3.bin'}
+            self.cache.cache_expiry = time.monotonic() + 1000
         
         mock_update.side_effect = side_effect
         
@@ -204,10 +295,83 @@ class TestFirmwareCache(unittest.TestCase):
         mock_update.assert_called_once_with(self.mock_project)
         self.assertEqual(result, 'notecard-8.1.3.bin')
 
+    @patch('manage_firmware.executor')
+    def test_retrieve_near_expiry_refreshes_in_background(self, mock_executor):
+        """Test that a cache close to expiry is served immediately and refreshed in the background."""
+        self.cache.cache = {('notecard', '8.1.3'): 'notecard-8.1.3.bin'}
+        self.cache.cache_expiry = time.monotonic() + 60
+        self.mock_project.fetchAvailableFirmware.return_value = [
+            {'type': 'notecard', 'version': '8.1.4', 'filename': 'notecard-8.1.4.bin'}
+        ]
+        
+        result = self.cache.retrieve(self.mock_project, 'notecard', '8.1.3')
+        
+        self.assertEqual(result, 'notecard-8.1.3.bin')
+        self.mock_project.fetchAvailableFirmware.assert_not_called()
+        mock_executor.submit.assert_called_once()
+        
+        # A second caller does not queue another refresh while one is pending
+        self.cache.retrieve(self.mock_project, 'notecard', '8.1.3')
+        mock_executor.submit.assert_called_once()
+        
+        # Run the queued refresh
+        refresh, *args = mock_executor.submit.call_args.args
+        refresh(*args)
+        
+        self.assertEqual(self.cache.cache, {('notecard', '8.1.4'): 'notecard-8.1.4.bin'})
+        self.assertGreater(self.cache.cache_expiry, time.monotonic() + 1000)
+        self.assertFalse(self.cache._refreshing)
+
+    @patch('manage_firmware.executor')
+    def test_failed_background_refresh_allows_retry(self, mock_executor):
+        """Test that a failed background refresh keeps the current cache and can be queued again."""
+        self.cache.cache = {('notecard', '8.1.3'): 'notecard-8.1.3.bin'}
+        self.cache.cache_expiry = time.monotonic() + 60
+        self.mock_project.fetchAvailableFirmware.side_effect = Exception("Notehub unavailable")
+        
+        self.cache.retrieve(self.mock_project, 'notecard', '8.1.3')
+        refresh, *args = mock_executor.submit.call_args.args
+        with self.assertRaises(Exception):
+            refresh(*args)
+        
+        self.assertEqual(self.cache.cache, {('notecard', '8.1.3'): 'notecard-8.1.3.bin'})
+        self.assertFalse(self.cache._refreshing)
+        
+        self.cache.retrieve(self.mock_project, 'notecard', '8.1.3')
+        self.assertEqual(mock_executor.submit.call_count, 2)
+
+    @patch('manage_firmware.executor')
+    def test_retrieve_fresh_cache_does_not_refresh(self, mock_executor):
+        """Test that a cache well within its lifetime is not refreshed."""
+        self.cache.cache = {('notecard', '8.1.3'): 'notecard-8.1.3.bin'}
+        self.cache.cache_expiry = time.monotonic() + 1000
+        
+        self.cache.retrieve(self.mock_project, 'notecard', '8.1.3')
+        
+        mock_executor.submit.assert_not_called()
+
+    def test_concurrent_retrieve_updates_expired_cache_once(self):
+        """Test that concurrent retrieves of an expired cache only fetch the firmware library once."""
+        def slow_fetch():
+            time.sleep(0.05)
+            return [{'type': 'notecard', 'version': '8.1.3', 'filename': 'notecard-8.1.3.bin'}]
+        
+        self.mock_project.fetchAvailableFirmware.side_effect = slow_fetch
+        results = []
+        
+        threads = [threading.Thread(target=lambda: results.append(self.cache.retrieve(self.mock_project, 'notecard', '8.1.3'))) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        self.mock_project.fetchAvailableFirmware.assert_called_once()
+        self.assertEqual(results, ['notecard-8.1.3.bin'] * 4)
+
     def test_firmware_cache_retrieve_invalid_filename_empty_string(self):
         """Test FirmwareCache.retrieve raises exception for empty filename string."""
-        self.cache.cache = {manage_firmware.FirmwareType.Notecard: {"1.0.0": ""}}  
-        self.cache.cache_expiry = time.time() + 1000
+        self.cache.cache = {(manage_firmware.FirmwareType.Notecard, "1.0.0"): ""}  
+        self.cache.cache_expiry = time.monotonic() + 1000
         
         with self.assertRaises(Exception) as context:
             self.cache.retrieve(self.mock_project, manage_firmware.FirmwareType.Notecard, "1.0.0")
@@ -216,8 +380,8 @@ class TestFirmwareCache(unittest.TestCase):
 
     def test_firmware_cache_retrieve_invalid_filename_non_string(self):
         """Test FirmwareCache.retrieve raises exception for non-string filename."""
-        self.cache.cache = {manage_firmware.FirmwareType.Notecard: {"1.0.0": None}}  
-        self.cache.cache_expiry = time.time() + 1000
+        self.cache.cache = {(manage_firmware.FirmwareType.Notecard, "1.0.0"): None}  
+        self.cache.cache_expiry = time.monotonic() + 1000
         
         with self.assertRaises(Exception) as context:
             self.cache.retrieve(self.mock_project, manage_firmware.FirmwareType.Notecard, "1.0.0")
@@ -227,8 +391,8 @@ class TestFirmwareCache(unittest.TestCase):
     def test_firmware_cache_retrieve_empty_versions_list(self):
         """Test FirmwareCache.retrieve raises exception when firmware type exists but has no versions."""
         # Set up cache with firmware type present but empty versions dict
-        self.cache.cache = {manage_firmware.FirmwareType.Notecard: {}}  # Empty versions
-        self.cache.cache_expiry = time.time() + 1000  # Don't expire
+        self.cache.cache = {}  # No versions for any firmware type
+        self.cache.cache_expiry = time.monotonic() + 1000  # Don't expire
         
         with self.assertRaises(Exception) as context:
             self.cache.retrieve(self.mock_project, manage_firmware.FirmwareType.Notecard, "8.1.3")
@@ -244,6 +408,118 @@ class TestFirmwareCache(unittest.TestCase):
 
 
 
+class TestDeviceStatusCache(unittest.TestCase):
+    """Test cases for DeviceStatusCache class."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.cache = manage_firmware.DeviceStatusCache(expiration_duration_seconds=30)
+        self.fetch = MagicMock(return_value={'version': '8.1.3'})
+    
+    def test_retrieve_fetches_on_miss(self):
+        """Test that a cache miss fetches and stores the value."""
+        result = self.cache.retrieve(('device123', 'notecard'), self.fetch)
+        
+        self.assertEqual(result, {'version': '8.1.3'})
+        self.fetch.assert_called_once()
+        self.assertIn(('device123', 'notecard'), self.cache.cache)
+    
+    def test_retrieve_reuses_unexpired_value(self):
+        """Test that an unexpired value is returned without fetching again."""
+        self.cache.retrieve(('device123', 'notecard'), self.fetch)
+        result = self.cache.retrieve(('device123', 'notecard'), self.fetch)
+        
+        self.assertEqual(result, {'version': '8.1.3'})
+        self.fetch.assert_called_once()
+    
+    @patch('manage_firmware.time.monotonic')
+    def test_retrieve_refetches_expired_value(self, mock_time):
+        """Test that an expired value is fetched again."""
+        mock_time.return_value = 1000
+        self.cache.retrieve(('device123', 'notecard'), self.fetch)
+        
+        mock_time.return_value = 1030
+        self.cache.retrieve(('device123', 'notecard'), self.fetch)
+        
+        self.assertEqual(self.fetch.call_count, 2)
+    
+    def test_invalidate_only_removes_device_entries(self):
+        """Test that invalidate removes all entries for a device and keeps other devices."""
+        self.cache.retrieve(('device123', 'notecard'), self.fetch)
+        self.cache.retrieve(('device123', 'host'), self.fetch)
+        self.cache.retrieve(('device456', 'notecard'), self.fetch)
+        
+        self.cache.invalidate('device123')
+        
+        self.assertEqual(list(self.cache.cache.keys()), [('device456', 'notecard')])
+    
+    @patch('manage_firmware.time.monotonic')
+    def test_expired_entries_pruned_when_full(self, mock_time):
+        """Test that expired entries are dropped once the cache reaches its size limit."""
+        cache = manage_firmware.DeviceStatusCache(expiration_duration_seconds=30, max_entries=2)
+        mock_time.return_value = 1000
+        cache.retrieve(('device1', 'notecard'), self.fetch)
+        cache.retrieve(('device2', 'notecard'), self.fetch)
+        
+        mock_time.return_value = 2000
+        cache.retrieve(('device3', 'notecard'), self.fetch)
+        
+        self.assertEqual(list(cache.cache.keys()), [('device3', 'notecard')])
+
+    def test_size_limited_when_entries_are_fresh(self):
+        """Test that the oldest entries are evicted when the cache is full of unexpired entries."""
+        cache = manage_firmware.DeviceStatusCache(expiration_duration_seconds=30, max_entries=4)
+        for i in range(10):
+            cache.retrieve((f'device{i}', 'notecard'), self.fetch)
+        
+        self.assertLessEqual(len(cache.cache), 4)
+        self.assertEqual([k[0] for k in cache.cache], ['device6', 'device7', 'device8', 'device9'])
+    
+    @patch('manage_firmware.time.monotonic')
+    def test_refetched_entry_is_evicted_last(self, mock_time):
+        """Test that an entry fetched again is treated as the newest entry when evicting."""
+        cache = manage_firmware.DeviceStatusCache(expiration_duration_seconds=30, max_entries=2)
+        mock_time.return_value = 1000
+        cache.retrieve(('device1', 'notecard'), self.fetch)
+        cache.retrieve(('device2', 'notecard'), self.fetch)
+        
+        mock_time.return_value = 1020
+        cache.retrieve(('device1', 'notecard'), self.fetch)  # Still cached, not refetched
+        mock_time.return_value = 1040
+        cache.retrieve(('device1', 'notecard'), self.fetch)  # Expired, refetched
+        cache.retrieve(('device3', 'notecard'), self.fetch)
+        
+        self.assertEqual(list(cache.cache.keys()), [('device1', 'notecard'), ('device3', 'notecard')])
+
+    def test_concurrent_retrieve_and_invalidate(self):
+        """Test that invalidate and pruning are safe while other threads insert entries."""
+        cache = manage_firmware.DeviceStatusCache(expiration_duration_seconds=30, max_entries=64)
+        errors = []
+        
+        def writer(n):
+            try:
+                for i in range(2000):
+                    cache.retrieve((f'device{n}-{i}', 'notecard'), self.fetch)
+            except Exception as e:
+                errors.append(e)
+        
+        def invalidator():
+            try:
+                for i in range(2000):
+                    cache.invalidate(f'device0-{i}')
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(3)]
+        threads.append(threading.Thread(target=invalidator))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        self.assertEqual(errors, [])
+
+
 class TestFetchDeviceFirmwareInfo(unittest.TestCase):
     """Test cases for fetchDeviceFirmwareInfo function."""
     
@@ -286,6 +562,57 @@ class TestFetchDeviceFirmwareInfo(unittest.TestCase):
         self.assertEqual(result, {})
 
 
+class TestFirmwareVersion(unittest.TestCase):
+    """Test cases for firmwareVersion function."""
+    
+    def test_firmware_version_formats(self):
+        """Test version extraction from firmware info objects and bare version strings."""
+        test_cases = [
+            ({'version': '8.1.3.17074', 'built': '2024-01-15'}, '8.1.3.17074'),
+            ({}, None),
+            ('8.1.3.17074', '8.1.3.17074'),
+            (None, None)
+        ]
+        
+        for firmware_info, expected in test_cases:
+            with self.subTest(firmware_info=firmware_info):
+                self.assertEqual(manage_firmware.firmwareVersion(firmware_info), expected)
+
+
+class TestEnsureCurrentVersions(unittest.TestCase):
+    """Test cases for ensureCurrentVersions function."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.mock_project = MagicMock()
+        manage_firmware.deviceStatusCache.cache.clear()
+        self.addCleanup(manage_firmware.deviceStatusCache.cache.clear)
+    
+    def test_versions_supplied_by_caller(self):
+        """Test that supplied firmware info is used without fetching."""
+        device_data = {'firmware_notecard': {'version': '8.1.3'}, 'firmware_host': '3.1.2'}
+        
+        result = manage_firmware.ensureCurrentVersions(self.mock_project, 'device123', device_data)
+        
+        self.assertEqual(result, ('8.1.3', '3.1.2'))
+        self.mock_project.getDeviceFirmwareUpdateHistory.assert_not_called()
+    
+    def test_missing_versions_are_fetched_and_stored(self):
+        """Test that missing firmware info is fetched once and stored in the device data."""
+        history = {
+            'notecard': {'current': {'version': '8.1.3'}},
+            'host': {'current': {'version': '3.1.2'}}
+        }
+        self.mock_project.getDeviceFirmwareUpdateHistory.side_effect = lambda deviceUID, firmwareType: history[firmwareType]
+        device_data = {}
+        
+        self.assertEqual(manage_firmware.ensureCurrentVersions(self.mock_project, 'device123', device_data), ('8.1.3', '3.1.2'))
+        self.assertEqual(manage_firmware.ensureCurrentVersions(self.mock_project, 'device123', device_data), ('8.1.3', '3.1.2'))
+        
+        self.assertEqual(self.mock_project.getDeviceFirmwareUpdateHistory.call_count, 2)
+        self.assertEqual(device_data, {'firmware_notecard': {'version': '8.1.3'}, 'firmware_host': {'version': '3.1.2'}})
+
+
 class TestCheckUpdateToTargetVersion(unittest.TestCase):
     """Test cases for checkUpdateToTargetVersion function."""
     
@@ -293,17 +620,15 @@ class TestCheckUpdateToTargetVersion(unittest.TestCase):
         self.mock_project = MagicMock()
     
     def test_check_update_firmware_cache_exception(self):
-        """Test checkUpdateToTargetVersion handles firmwareCache.retrieve exceptions."""
-        with patch.object(manage_firmware.firmwareCache, 'retrieve') as mock_retrieve:
+        """Test checkUpdateToTargetVersion handles exceptions while refreshing the firmware cache."""
+        with patch.object(manage_firmware.FirmwareCache, 'try_retrieve') as mock_retrieve:
             mock_retrieve.side_effect = Exception("Cache retrieval failed")
             
-            target_versions = {manage_firmware.FirmwareType.Notecard: "2.0.0"}
-            
             should_update, message, target_version, filename = manage_firmware.checkUpdateToTargetVersion(
                 self.mock_project, 
                 'device123', 
                 '1.0.0',  # current version
-                target_versions, 
+                '2.0.0',  # target version
                 manage_firmware.FirmwareType.Notecard
             )
             
@@ -313,24 +638,32 @@ class TestCheckUpdateToTargetVersion(unittest.TestCase):
             self.assertEqual(target_version, "2.0.0")
             self.assertIsNone(filename)
     
-    def test_check_update_firmware_cache_returns_none(self):
-        """Test checkUpdateToTargetVersion handles when firmwareCache.retrieve returns None."""
-        with patch.object(manage_firmware.firmwareCache, 'retrieve') as mock_retrieve:
-            mock_retrieve.return_value = None  # Return None instead of filename
-            
-            target_versions = {manage_firmware.FirmwareType.Notecard: "2.0.0"}
+    def test_check_update_without_target_version(self):
+        """Test checkUpdateToTargetVersion when no target version is requested."""
+        should_update, message, target_version, filename = manage_firmware.checkUpdateToTargetVersion(
+            self.mock_project, 'device123', '1.0.0', None, manage_firmware.FirmwareType.Host
+        )
+        
+        self.assertFalse(should_update)
+        self.assertEqual(message, "No firmware update request for host")
+        self.assertIsNone(target_version)
+        self.assertIsNone(filename)
+    
+    def test_check_update_firmware_not_in_cache(self):
+        """Test checkUpdateToTargetVersion when the target version is not in the firmware cache."""
+        with patch.object(manage_firmware.FirmwareCache, 'try_retrieve') as mock_retrieve:
+            mock_retrieve.return_value = (False, "Firmware version 2.0.0 for notecard not available in local firmware cache.")
             
             should_update, message, target_version, filename = manage_firmware.checkUpdateToTargetVersion(
                 self.mock_project, 
                 'device123', 
                 '1.0.0',  # current version
-                target_versions, 
+                '2.0.0',  # target version
                 manage_firmware.FirmwareType.Notecard
             )
             
             self.assertFalse(should_update)
-            self.assertIn("Cannot update", message)
-            self.assertIn("Unable to locate", message)
+            self.assertEqual(message, "Cannot update notecard: Firmware version 2.0.0 for notecard not available in local firmware cache.")
             self.assertEqual(target_version, "2.0.0")
             self.assertIsNone(filename)
 
@@ -341,6 +674,8 @@ class TestManageFirmware(unittest.TestCase):
     def setUp(self):
         """Set up test fixtures."""
         self.mock_project = MagicMock()
+        manage_firmware.deviceStatusCache.cache.clear()
+        self.addCleanup(manage_firmware.deviceStatusCache.cache.clear)
         
     def test_no_rule_conditions_met(self):
         """Test when no rule conditions are met."""
@@ -374,11 +709,12 @@ class TestManageFirmware(unittest.TestCase):
 
     def test_fetch_missing_firmware_versions(self):
         """Test fetching missing firmware versions."""
-        # Mock the project methods that will be called
-        self.mock_project.getDeviceFirmwareUpdateHistory.side_effect = [
-            {'current': {'version': '8.1.3'}},  # notecard version
-            {'current': {'version': '3.1.2'}}   # host version  
-        ]
+        # Mock the project methods that will be called (requests may be issued concurrently)
+        history = {
+            'notecard': {'current': {'version': '8.1.3'}},
+            'host': {'current': {'version': '3.1.2'}}
+        }
+        self.mock_project.getDeviceFirmwareUpdateHistory.side_effect = lambda deviceUID, firmwareType: history[firmwareType]
         
         # Call manageFirmware with device_data missing firmware info to trigger fetching
         device_data = {'fleets': ['fleet123']}  # Missing firmware info
@@ -395,6 +731,18 @@ class TestManageFirmware(unittest.TestCase):
             call('device123', 'host')
         ]
         self.mock_project.getDeviceFirmwareUpdateHistory.assert_has_calls(expected_calls, any_order=True)
+        self.assertEqual(device_data['firmware_notecard'], {'version': '8.1.3'})
+        self.assertEqual(device_data['firmware_host'], {'version': '3.1.2'})
+
+    def test_fetch_only_missing_firmware_version(self):
+        """Test that only the missing firmware version is fetched."""
+        self.mock_project.getDeviceFirmwareUpdateHistory.return_value = {'current': {'version': '3.1.2'}}
+        
+        device_data = {'firmware_notecard': {'version': '8.1.3'}}
+        manage_firmware.manageFirmware(self.mock_project, 'device123', device_data, [])
+        
+        self.mock_project.getDeviceFirmwareUpdateHistory.assert_called_once_with('device123', 'host')
+        self.assertEqual(device_data['firmware_host'], {'version': '3.1.2'})
 
     def test_notecard_update_in_progress(self):
         """Test when notecard update is already in progress."""
@@ -407,8 +755,9 @@ class TestManageFirmware(unittest.TestCase):
         }
         
         # Mock notecard update in progress
-        self.mock_project.getDeviceFirmwareUpdateStatus.return_value = {
-            'dfu_in_progress': True
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.return_value = {
+            'notecard': {'dfu_in_progress': True},
+            'host': {'dfu_in_progress': False}
         }
         
         result = manage_firmware.manageFirmware(
@@ -419,7 +768,7 @@ class TestManageFirmware(unittest.TestCase):
             result, 
             "According to rule id rule-1, firmware requirements NOT met.  Update not requested because Notecard update is in progress"
         )
-        self.mock_project.getDeviceFirmwareUpdateStatus.assert_called_once_with('device123', 'notecard')
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.assert_called_once_with('device123')
 
     def test_host_update_in_progress(self):
         """Test when host update is already in progress."""
@@ -432,10 +781,10 @@ class TestManageFirmware(unittest.TestCase):
         }
         
         # Mock no notecard update in progress, but host update in progress
-        self.mock_project.getDeviceFirmwareUpdateStatus.side_effect = [
-            {'dfu_in_progress': False},  # Notecard not in progress
-            {'dfu_in_progress': True}    # Host in progress
-        ]
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.return_value = {
+            'notecard': {'dfu_in_progress': False},
+            'host': {'dfu_in_progress': True}
+        }
         
         result = manage_firmware.manageFirmware(
             self.mock_project, 'device123', device_data, rules
@@ -445,7 +794,7 @@ class TestManageFirmware(unittest.TestCase):
             result,
             "According to rule id rule-1, firmware requirements NOT met.  Update not requested because Host update is in progress"
         )
-        self.assertEqual(self.mock_project.getDeviceFirmwareUpdateStatus.call_count, 2)
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.assert_called_once_with('device123')
 
     def test_successful_firmware_updates(self):
         """Test successful firmware update requests."""
@@ -458,14 +807,14 @@ class TestManageFirmware(unittest.TestCase):
         }
         
         # Mock no updates in progress
-        self.mock_project.getDeviceFirmwareUpdateStatus.return_value = {'dfu_in_progress': False}
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.return_value = NO_UPDATES_IN_PROGRESS
         
         # Mock the cache retrieval to return valid firmware files
         manage_firmware.firmwareCache.cache = {
-            'notecard': {'8.1.4': 'notecard-8.1.4.bin'},
-            'host': {'3.1.3': 'host-3.1.3.bin'}
+            ('notecard', '8.1.4'): 'notecard-8.1.4.bin',
+            ('host', '3.1.3'): 'host-3.1.3.bin'
         }
-        manage_firmware.firmwareCache.cache_expiry = time.time() + 1000
+        manage_firmware.firmwareCache.cache_expiry = time.monotonic() + 1000
         
         result = manage_firmware.manageFirmware(
             self.mock_project, 'device123', device_data, rules
@@ -479,6 +828,66 @@ class TestManageFirmware(unittest.TestCase):
         # Verify requestDeviceFirmwareUpdate was called for both firmware types
         self.assertEqual(self.mock_project.requestDeviceFirmwareUpdate.call_count, 2)
     
+    def test_repeated_calls_reuse_cached_device_status(self):
+        """Test that processing a device again reuses its cached firmware info and DFU status."""
+        rules = [{"id": "rule-1", "conditions": None, "target_versions": {"notecard": "8.1.4"}}]
+        history = {
+            'notecard': {'current': {'version': '8.1.3'}},
+            'host': {'current': {'version': '3.1.2'}}
+        }
+        self.mock_project.getDeviceFirmwareUpdateHistory.side_effect = lambda deviceUID, firmwareType: history[firmwareType]
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.return_value = NO_UPDATES_IN_PROGRESS
+        
+        manage_firmware.firmwareCache.cache = {('notecard', '8.1.4'): 'notecard-8.1.4.bin'}
+        manage_firmware.firmwareCache.cache_expiry = time.monotonic() + 1000
+        
+        for _ in range(2):
+            manage_firmware.manageFirmware(self.mock_project, 'device123', {}, rules, is_dry_run=True)
+        
+        self.assertEqual(self.mock_project.getDeviceFirmwareUpdateHistory.call_count, 2)
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.assert_called_once_with('device123')
+    
+    def test_update_request_invalidates_cached_device_status(self):
+        """Test that requesting an update evicts the device from the status cache."""
+        rules = [{"id": "rule-1", "conditions": None, "target_versions": {"notecard": "8.1.4"}}]
+        self.mock_project.getDeviceFirmwareUpdateHistory.return_value = {'current': {'version': '8.1.3'}}
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.return_value = NO_UPDATES_IN_PROGRESS
+        
+        manage_firmware.firmwareCache.cache = {('notecard', '8.1.4'): 'notecard-8.1.4.bin'}
+        manage_firmware.firmwareCache.cache_expiry = time.monotonic() + 1000
+        
+        manage_firmware.manageFirmware(self.mock_project, 'device123', {}, rules)
+        
+        self.mock_project.requestDeviceFirmwareUpdate.assert_called_once()
+        self.assertEqual(manage_firmware.deviceStatusCache.cache, {})
+    
+    def test_firmware_updates_with_version_strings(self):
+        """Test firmware update requests when firmware info is provided as bare version strings."""
+        rules = [{"id": "rule-1", "conditions": None, "target_versions": {"notecard": "8.1.4", "host": "3.1.3"}}]
+        device_data = {
+            'fleets': ['fleet123'],
+            'firmware_notecard': '8.1.3',
+            'firmware_host': '3.1.3'
+        }
+        
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.return_value = NO_UPDATES_IN_PROGRESS
+        
+        manage_firmware.firmwareCache.cache = {
+            ('notecard', '8.1.4'): 'notecard-8.1.4.bin',
+            ('host', '3.1.3'): 'host-3.1.3.bin'
+        }
+        manage_firmware.firmwareCache.cache_expiry = time.monotonic() + 1000
+        
+        result = manage_firmware.manageFirmware(
+            self.mock_project, 'device123', device_data, rules
+        )
+        
+        expected_result = ("According to rule id rule-1, "
+                          "Requested notecard firmware update from 8.1.3 to 8.1.4. "
+                          "Skipping update request for host. Already at target version of 3.1.3.")
+        self.assertEqual(result, expected_result)
+        self.mock_project.requestDeviceFirmwareUpdate.assert_called_once_with('device123', 'notecard-8.1.4.bin', 'notecard')
+    
     def test_dry_run_no_rule_conditions_met(self):
         """Test dry-run mode when no rule conditions are met."""
         device_data = {
@@ -517,8 +926,9 @@ class TestManageFirmware(unittest.TestCase):
         }
         
         # Mock notecard update in progress
-        self.mock_project.getDeviceFirmwareUpdateStatus.return_value = {
-            'dfu_in_progress': True
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.return_value = {
+            'notecard': {'dfu_in_progress': True},
+            'host': {'dfu_in_progress': False}
         }
         
         result = manage_firmware.manageFirmware(
@@ -529,7 +939,7 @@ class TestManageFirmware(unittest.TestCase):
             result, 
             "Dry-Run: According to rule id rule-1, firmware requirements NOT met.  Update not requested because Notecard update is in progress"
         )
-        self.mock_project.getDeviceFirmwareUpdateStatus.assert_called_once_with('device123', 'notecard')
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.assert_called_once_with('device123')
     
     def test_dry_run_successful_firmware_updates(self):
         """Test dry-run mode for successful firmware update checks."""
@@ -541,14 +951,14 @@ class TestManageFirmware(unittest.TestCase):
         }
         
         # Mock no updates in progress
-        self.mock_project.getDeviceFirmwareUpdateStatus.return_value = {'dfu_in_progress': False}
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.return_value = NO_UPDATES_IN_PROGRESS
         
         # Mock the cache retrieval to return valid firmware files
         manage_firmware.firmwareCache.cache = {
-            'notecard': {'8.1.4': 'notecard-8.1.4.bin'},
-            'host': {'3.1.3': 'host-3.1.3.bin'}
+            ('notecard', '8.1.4'): 'notecard-8.1.4.bin',
+            ('host', '3.1.3'): 'host-3.1.3.bin'
         }
-        manage_firmware.firmwareCache.cache_expiry = time.time() + 1000
+        manage_firmware.firmwareCache.cache_expiry = time.monotonic() + 1000
         
         result = manage_firmware.manageFirmware(
             self.mock_project, 'device123', device_data, rules, is_dry_run=True
@@ -572,7 +982,7 @@ class TestManageFirmware(unittest.TestCase):
         }
         
         # Mock no updates in progress
-        self.mock_project.getDeviceFirmwareUpdateStatus.return_value = {'dfu_in_progress': False}
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.return_value = NO_UPDATES_IN_PROGRESS
         
         result = manage_firmware.manageFirmware(
             self.mock_project, 'device123', device_data, rules, is_dry_run=True
@@ -585,6 +995,23 @@ class TestManageFirmware(unittest.TestCase):
         
         # Verify requestDeviceFirmwareUpdate was NOT called
         self.mock_project.requestDeviceFirmwareUpdate.assert_not_called()
+        # No update is possible, so the DFU status is not requested
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.assert_not_called()
+    
+    def test_already_at_target_skips_pending_update_check(self):
+        """Test that a device at its target versions is not checked for pending updates."""
+        rules = [{"id": "rule-1", "conditions": None, "target_versions": {"notecard": "8.1.3"}}]
+        device_data = {
+            'firmware_notecard': {'version': '8.1.3'},
+            'firmware_host': {'version': '3.1.2'}
+        }
+        
+        result = manage_firmware.manageFirmware(self.mock_project, 'device123', device_data, rules)
+        
+        self.assertEqual(result, "According to rule id rule-1, "
+                                 "Skipping update request for notecard. Already at target version of 8.1.3. "
+                                 "No firmware update request for host")
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.assert_not_called()
     
     def test_normal_vs_dry_run_comparison(self):
         """Test that normal and dry-run modes behave differently for the same scenario."""
@@ -596,14 +1023,13 @@ class TestManageFirmware(unittest.TestCase):
         }
         
         # Mock no updates in progress
-        self.mock_project.getDeviceFirmwareUpdateStatus.return_value = {'dfu_in_progress': False}
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.return_value = NO_UPDATES_IN_PROGRESS
         
         # Mock the cache retrieval
         manage_firmware.firmwareCache.cache = {
-            'notecard': {'8.1.4': 'notecard-8.1.4.bin'},
-            'host': {}
+            ('notecard', '8.1.4'): 'notecard-8.1.4.bin'
         }
-        manage_firmware.firmwareCache.cache_expiry = time.time() + 1000
+        manage_firmware.firmwareCache.cache_expiry = time.monotonic() + 1000
         
         # Test dry-run mode
         dry_run_result = manage_firmware.manageFirmware(
@@ -612,7 +1038,7 @@ class TestManageFirmware(unittest.TestCase):
         
         # Reset the mock
         self.mock_project.reset_mock()
-        self.mock_project.getDeviceFirmwareUpdateStatus.return_value = {'dfu_in_progress': False}
+        self.mock_project.getDeviceFirmwareUpdateStatusAll.return_value = NO_UPDATES_IN_PROGRESS
         
         # Test normal mode  
         normal_result = manage_firmware.manageFirmware(
@@ -631,5 +1057,58 @@ class TestManageFirmware(unittest.TestCase):
         self.mock_project.requestDeviceFirmwareUpdate.assert_called_once()
 
 
+
+class TestManageFirmwareBulk(unittest.TestCase):
+    """Test cases for manageFirmwareBulk function."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.mock_project = MagicMock()
+    
+    @patch('manage_firmware.manageFirmware')
+    def test_bulk_manages_each_device(self, mock_manage_firmware):
+        """Test that every device is managed with its own device data."""
+        mock_manage_firmware.side_effect = lambda project, deviceUID, device_data, rules, is_dry_run: f"managed {deviceUID}"
+        devices = {
+            'dev:1': {'firmware_notecard': {'version': '8.1.3'}},
+            'dev:2': {'firmware_notecard': {'version': '8.1.4'}}
+        }
+        rules = [{"id": "rule-1", "conditions": None, "target_versions": None}]
+        
+        result = manage_firmware.manageFirmwareBulk(self.mock_project, devices, rules, is_dry_run=True)
+        
+        self.assertEqual(result, {'dev:1': 'managed dev:1', 'dev:2': 'managed dev:2'})
+        mock_manage_firmware.assert_has_calls([
+            call(self.mock_project, 'dev:1', devices['dev:1'], rules=rules, is_dry_run=True),
+            call(self.mock_project, 'dev:2', devices['dev:2'], rules=rules, is_dry_run=True)
+        ], any_order=True)
+    
+    @patch('manage_firmware.manageFirmware')
+    def test_bulk_rejects_device_uids(self, mock_manage_firmware):
+        """Test that a list of device UIDs without device data is rejected."""
+        with self.assertRaises(Exception) as context:
+            manage_firmware.manageFirmwareBulk(self.mock_project, ['dev:1', 'dev:2'])
+        
+        self.assertEqual(str(context.exception), "devices must be a dict of device UID to device data")
+        mock_manage_firmware.assert_not_called()
+    
+    @patch('manage_firmware.manageFirmware')
+    def test_bulk_reports_device_errors(self, mock_manage_firmware):
+        """Test that a failure for one device does not stop the others."""
+        def manage(project, deviceUID, device_data, rules, is_dry_run):
+            if deviceUID == 'dev:2':
+                raise Exception("Notehub path not found")
+            return "No rule conditions met. No updates required"
+        mock_manage_firmware.side_effect = manage
+        
+        result = manage_firmware.manageFirmwareBulk(self.mock_project, {'dev:1': {}, 'dev:2': {}})
+        
+        self.assertEqual(result['dev:1'], "No rule conditions met. No updates required")
+        self.assertEqual(result['dev:2'], "Unable to manage firmware for dev:2: Notehub path not found")
+    
+    def test_bulk_with_no_devices(self):
+        """Test that no devices returns an empty result."""
+        self.assertEqual(manage_firmware.manageFirmwareBulk(self.mock_project, {}), {})
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -9,7 +9,9 @@ This test suite validates the Notehub API integration functionality including:
 Uses comprehensive urllib3 mocking to avoid external dependencies.
 """
 
+import threading
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock, patch, call
 import sys
 import os
@@ -57,6 +59,7 @@ class TestNotehubClientService(unittest.TestCase):
         self.client_id = "test_client_id"
         self.client_secret = "test_client_secret"
         self.user_token = "test_user_token"
+        notehub._oauth_token_cache.clear()
         
     def test_init_with_user_token(self):
         """Test initialization with user access token."""
@@ -142,6 +145,59 @@ class TestNotehubClientService(unittest.TestCase):
         
         self.assertEqual(result, {"result": "success"})
 
+    @patch('notehub.http')
+    def test_v1_get_request_has_no_body(self, mock_http):
+        """Test that GET requests without a payload are sent without a body."""
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            user_access_token=self.user_token
+        )
+        mock_http.request.return_value = MagicMock(status=200, data=b'{}')
+        
+        client.v1Request("devices")
+        
+        self.assertNotIn('body', mock_http.request.call_args[1])
+
+    @patch('notehub.http')
+    def test_v1_post_request_without_payload_sends_empty_object(self, mock_http):
+        """Test that POST requests without a payload still send an empty JSON object."""
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            user_access_token=self.user_token
+        )
+        mock_http.request.return_value = MagicMock(status=200, data=b'{}')
+        
+        client.v1Request("devices/dev:1/enable", method='POST')
+        
+        self.assertEqual(mock_http.request.call_args[1]['body'], '{}')
+
+    @patch('notehub.http')
+    def test_v1_request_without_params_has_no_query_string(self, mock_http):
+        """Test that the URL for a request without parameters has no query string."""
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            user_access_token=self.user_token
+        )
+        mock_http.request.return_value = MagicMock(status=200, data=b'{}')
+        
+        client.v1Request("firmware")
+        
+        self.assertEqual(mock_http.request.call_args[0][1], f"https://api.notefile.net/v1/projects/{self.project_uid}/firmware")
+
+    @patch('notehub.http')
+    def test_v1_request_list_params(self, mock_http):
+        """Test that list parameters are sent as repeated query keys."""
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            user_access_token=self.user_token
+        )
+        mock_http.request.return_value = MagicMock(status=200, data=b'{}')
+        
+        client.v1Request("dfu/host/status", params={"deviceUID": ["dev:1", "dev:2"]})
+        
+        url = mock_http.request.call_args[0][1]
+        self.assertTrue(url.endswith("dfu/host/status?deviceUID=dev%3A1&deviceUID=dev%3A2"))
+
     @patch('notehub.http')
     def test_v1_request_error(self, mock_http):
         """Test v1 API request with error response."""
@@ -268,7 +324,7 @@ class TestNotehubClientService(unittest.TestCase):
         # Mock successful token response
         token_response = MagicMock()
         token_response.status = 200
-        token_response.data = b'{"access_token": "test_token", "expires_in": 60}'
+        token_response.data = b'{"access_token": "test_token", "expires_in": 3600}'
         
         # Mock successful API response  
         api_response = MagicMock()
@@ -376,6 +432,41 @@ class TestNotehubClientService(unittest.TestCase):
         )
         self.assertEqual(result, mock_response)
 
+    @patch('notehub.http')
+    def test_request_method_does_not_modify_headers(self, mock_http):
+        """Test that caller headers and the client's shared headers are left unmodified."""
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            user_access_token=self.user_token
+        )
+        mock_http.request.return_value = MagicMock(status=200)
+        
+        existing_headers = {'Custom-Header': 'custom-value'}
+        client._request('POST', 'https://example.com', headers=existing_headers, body='test')
+        client._request('GET', 'https://example.com')
+        
+        self.assertEqual(existing_headers, {'Custom-Header': 'custom-value'})
+        self.assertNotIn('Custom-Header', mock_http.request.call_args_list[1][1]['headers'])
+        self.assertNotIn('X-Session-Token', client._shared_header)
+
+    @patch('notehub.http')
+    @patch('time.time')
+    def test_oauth_headers_reused_until_token_changes(self, mock_time, mock_http):
+        """Test that OAuth headers are built once per token."""
+        mock_time.return_value = 1000
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            client_id=self.client_id,
+            client_secret=self.client_secret
+        )
+        mock_http.request.return_value = MagicMock(status=200, data=b'{"access_token": "test_token", "expires_in": 3600}')
+        
+        first = client.getAuthHeader()
+        second = client.getAuthHeader()
+        
+        self.assertIs(first, second)
+        self.assertEqual(first['Authorization'], 'Bearer test_token')
+
     @patch('notehub.http')
     def test_request_method_401_error(self, mock_http):
         """Test _request method with 401 authentication error."""
@@ -390,10 +481,11 @@ class TestNotehubClientService(unittest.TestCase):
         mock_response.data = b'{"error": "Unauthorized"}'
         mock_http.request.return_value = mock_response
         
-        with self.assertRaises(Exception) as context:
+        with self.assertRaises(notehub.NotehubAuthError) as context:
             client._request('GET', 'https://example.com')
         
         self.assertEqual(str(context.exception), "Notehub authentication failed. Check API token(s)")
+        self.assertEqual(context.exception.status, 401)
 
     @patch('notehub.http')
     def test_request_method_404_error(self, mock_http):
@@ -409,10 +501,11 @@ class TestNotehubClientService(unittest.TestCase):
         mock_response.data = b'{"error": "Not found"}'
         mock_http.request.return_value = mock_response
         
-        with self.assertRaises(Exception) as context:
+        with self.assertRaises(notehub.NotehubNotFound) as context:
             client._request('GET', 'https://example.com/nonexistent')
         
         self.assertEqual(str(context.exception), "Notehub path not found")
+        self.assertIsInstance(context.exception, notehub.NotehubError)
 
     @patch('notehub.http')
     def test_request_method_generic_error(self, mock_http):
@@ -434,6 +527,112 @@ class TestNotehubClientService(unittest.TestCase):
         expected_msg = "Notehub Request Error: 500 - b'{\"error\": \"Internal server error\"}'"
         self.assertEqual(str(context.exception), expected_msg)
 
+    @patch('notehub.time.sleep')
+    @patch('notehub.http')
+    def test_v1_get_retries_transient_errors(self, mock_http, mock_sleep):
+        """Test that GET requests are retried with backoff after transient errors."""
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            user_access_token=self.user_token
+        )
+        
+        throttled = MagicMock(status=429, data=b'{"error": "Too many requests"}')
+        unavailable = MagicMock(status=503, data=b'{"error": "Service unavailable"}')
+        success = MagicMock(status=200, data=b'{"result": "success"}')
+        mock_http.request.side_effect = [throttled, unavailable, success]
+        
+        result = client.v1Request("devices")
+        
+        self.assertEqual(result, {"result": "success"})
+        self.assertEqual(mock_http.request.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+        first_delay, second_delay = (c.args[0] for c in mock_sleep.call_args_list)
+        self.assertGreaterEqual(first_delay, notehub.RETRY_BASE_DELAY_SECONDS)
+        self.assertGreaterEqual(second_delay, 2 * notehub.RETRY_BASE_DELAY_SECONDS)
+
+    @patch('notehub.time.sleep')
+    @patch('notehub.http')
+    def test_v1_get_honours_retry_after(self, mock_http, mock_sleep):
+        """Test that a Retry-After header on a rate limited response sets the retry delay."""
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            user_access_token=self.user_token
+        )
+        
+        throttled = MagicMock(status=429, data=b'{"error": "Too many requests"}', headers={"Retry-After": "3"})
+        success = MagicMock(status=200, data=b'{"result": "success"}')
+        mock_http.request.side_effect = [throttled, success]
+        
+        self.assertEqual(client.v1Request("devices"), {"result": "success"})
+        mock_sleep.assert_called_once_with(3.0)
+
+    @patch('notehub.time.sleep')
+    @patch('notehub.http')
+    def test_v1_get_caps_retry_after(self, mock_http, mock_sleep):
+        """Test that an excessive Retry-After header is capped."""
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            user_access_token=self.user_token
+        )
+        
+        throttled = MagicMock(status=429, data=b'{"error": "Too many requests"}', headers={"Retry-After": "3600"})
+        success = MagicMock(status=200, data=b'{"result": "success"}')
+        mock_http.request.side_effect = [throttled, success]
+        
+        client.v1Request("devices")
+        
+        mock_sleep.assert_called_once_with(notehub.RETRY_MAX_RETRY_AFTER_SECONDS)
+
+    @patch('notehub.time.sleep')
+    @patch('notehub.http')
+    def test_v1_get_retries_connection_errors(self, mock_http, mock_sleep):
+        """Test that GET requests are retried after connection errors."""
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            user_access_token=self.user_token
+        )
+        
+        success = MagicMock(status=200, data=b'{"result": "success"}')
+        mock_http.request.side_effect = [notehub.urllib3.exceptions.ProtocolError("Connection reset"), success]
+        
+        self.assertEqual(client.v1Request("devices"), {"result": "success"})
+        mock_sleep.assert_called_once()
+
+    @patch('notehub.time.sleep')
+    @patch('notehub.http')
+    def test_v1_get_gives_up_after_max_attempts(self, mock_http, mock_sleep):
+        """Test that transient errors are raised once all retry attempts are used."""
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            user_access_token=self.user_token
+        )
+        
+        mock_http.request.return_value = MagicMock(status=502, data=b'{"error": "Bad gateway"}')
+        
+        with self.assertRaises(notehub.NotehubError) as context:
+            client.v1Request("devices")
+        
+        self.assertEqual(context.exception.status, 502)
+        self.assertEqual(mock_http.request.call_count, notehub.RETRY_MAX_ATTEMPTS)
+        self.assertEqual(mock_sleep.call_count, notehub.RETRY_MAX_ATTEMPTS - 1)
+
+    @patch('notehub.time.sleep')
+    @patch('notehub.http')
+    def test_v1_post_is_not_retried(self, mock_http, mock_sleep):
+        """Test that non-idempotent requests such as firmware update requests are not retried."""
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            user_access_token=self.user_token
+        )
+        
+        mock_http.request.return_value = MagicMock(status=503, data=b'{"error": "Service unavailable"}')
+        
+        with self.assertRaises(notehub.NotehubError):
+            client.v1Request("dfu/notecard/update", {"filename": "notecard.bin"}, method='POST')
+        
+        mock_http.request.assert_called_once()
+        mock_sleep.assert_not_called()
+
     @patch('notehub.http')
     def test_request_method_with_oauth_headers(self, mock_http):
         """Test _request method with OAuth authentication headers."""
@@ -446,7 +645,7 @@ class TestNotehubClientService(unittest.TestCase):
         # Mock token response for OAuth
         token_response = MagicMock()
         token_response.status = 200
-        token_response.data = b'{"access_token": "oauth_token", "expires_in": 60}'
+        token_response.data = b'{"access_token": "oauth_token", "expires_in": 3600}'
         
         # Mock successful API response
         api_response = MagicMock()
@@ -506,7 +705,7 @@ class TestNotehubClientService(unittest.TestCase):
         # Mock token response
         token_response = MagicMock()
         token_response.status = 200
-        token_response.data = b'{"access_token": "test_token", "expires_in": 60}'
+        token_response.data = b'{"access_token": "test_token", "expires_in": 3600}'
         
         # Mock API responses
         api_response = MagicMock()
@@ -522,6 +721,289 @@ class TestNotehubClientService(unittest.TestCase):
         # Should only request token once (cached for second request)
         self.assertEqual(mock_http.request.call_count, 3)  # 1 token + 2 API calls
 
+    @patch('notehub.http')
+    @patch('time.time')
+    def test_oauth_token_refreshed_before_expiry(self, mock_time, mock_http):
+        """Test that an OAuth token close to expiry is replaced before it is used."""
+        mock_time.return_value = 1000
+        
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            client_id=self.client_id,
+            client_secret=self.client_secret
+        )
+        
+        first_token = MagicMock(status=200, data=b'{"access_token": "first_token", "expires_in": 3600}')
+        second_token = MagicMock(status=200, data=b'{"access_token": "second_token", "expires_in": 3600}')
+        api_response = MagicMock(status=200, data=b'{"result": "success"}')
+        mock_http.request.side_effect = [first_token, api_response, second_token, api_response]
+        
+        client.v1Request("devices")
+        expires_at = client._bearer_token["expires_at"]
+        
+        # Still valid, but within the refresh margin
+        mock_time.return_value = expires_at - notehub.TOKEN_REFRESH_MARGIN_SECONDS + 1
+        client.v1Request("devices")
+        
+        self.assertEqual(mock_http.request.call_count, 4)
+        self.assertEqual(mock_http.request.call_args_list[3][1]['headers']['Authorization'], 'Bearer second_token')
+
+
+    @patch('notehub.http')
+    @patch('time.time')
+    def test_oauth_token_shared_between_clients(self, mock_time, mock_http):
+        """Test that clients with the same credentials reuse one OAuth token."""
+        mock_time.return_value = 1000
+        
+        token_response = MagicMock(status=200, data=b'{"access_token": "shared_token", "expires_in": 3600}')
+        api_response = MagicMock(status=200, data=b'{"result": "success"}')
+        mock_http.request.side_effect = [token_response, api_response, api_response]
+        
+        for _ in range(2):
+            client = notehub.NotehubClientService(
+                project_uid=self.project_uid,
+                client_id=self.client_id,
+                client_secret=self.client_secret
+            )
+            client.v1Request("devices")
+        
+        self.assertEqual(mock_http.request.call_count, 3)  # 1 token + 2 API calls
+        self.assertEqual(mock_http.request.call_args_list[2][1]['headers']['Authorization'], 'Bearer shared_token')
+
+    @patch('notehub.http')
+    @patch('time.time')
+    def test_oauth_token_not_shared_between_credentials(self, mock_time, mock_http):
+        """Test that clients with different credentials request their own tokens."""
+        mock_time.return_value = 1000
+        
+        first_token = MagicMock(status=200, data=b'{"access_token": "first_token", "expires_in": 3600}')
+        second_token = MagicMock(status=200, data=b'{"access_token": "second_token", "expires_in": 3600}')
+        api_response = MagicMock(status=200, data=b'{"result": "success"}')
+        mock_http.request.side_effect = [first_token, api_response, second_token, api_response]
+        
+        for secret in ("secret_one", "secret_two"):
+            client = notehub.NotehubClientService(
+                project_uid=self.project_uid,
+                client_id=self.client_id,
+                client_secret=secret
+            )
+            client.v1Request("devices")
+        
+        self.assertEqual(mock_http.request.call_count, 4)
+        self.assertEqual(mock_http.request.call_args_list[3][1]['headers']['Authorization'], 'Bearer second_token')
+
+    @patch('notehub.http')
+    @patch('time.time')
+    def test_stale_401_keeps_refreshed_token(self, mock_time, mock_http):
+        """Test that a 401 for a token that was already replaced doesn't discard the replacement."""
+        mock_time.return_value = 1000
+        
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            client_id=self.client_id,
+            client_secret=self.client_secret
+        )
+        
+        first_token = MagicMock(status=200, data=b'{"access_token": "first_token", "expires_in": 3600}')
+        second_token = MagicMock(status=200, data=b'{"access_token": "second_token", "expires_in": 3600}')
+        unauthorized = MagicMock(status=401, data=b'{"error": "Unauthorized"}')
+        api_response = MagicMock(status=200, data=b'{"result": "success"}')
+        mock_http.request.side_effect = [first_token, unauthorized, second_token, api_response, api_response]
+        
+        client.v1Request("devices")
+        
+        # A second request sent with first_token is rejected after the token was refreshed
+        with patch.object(client, '_query_oauth_for_token', wraps=client._query_oauth_for_token) as mock_query:
+            client._invalidateBearerToken("first_token")
+            client.v1Request("devices")
+        
+        mock_query.assert_not_called()
+        self.assertEqual(client._bearer_token["access_token"], "second_token")
+        self.assertEqual(mock_http.request.call_args_list[4][1]['headers']['Authorization'], 'Bearer second_token')
+
+    @patch('notehub.http')
+    @patch('time.time')
+    def test_concurrent_401s_fetch_one_new_token(self, mock_time, mock_http):
+        """Test that requests rejected with the same token only fetch one new token between them."""
+        mock_time.return_value = 1000
+        
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            client_id=self.client_id,
+            client_secret=self.client_secret
+        )
+        
+        token_responses = iter([b'{"access_token": "first_token", "expires_in": 3600}',
+                                b'{"access_token": "second_token", "expires_in": 3600}',
+                                b'{"access_token": "third_token", "expires_in": 3600}'])
+        both_sent = threading.Barrier(2)
+        
+        def request(method, url, headers=None, body=None):
+            if url.endswith('/oauth2/token'):
+                return MagicMock(status=200, data=next(token_responses))
+            if headers['Authorization'] == 'Bearer first_token':
+                # Both requests are in flight with first_token before either is rejected
+                both_sent.wait(5)
+                return MagicMock(status=401, data=b'{"error": "Unauthorized"}')
+            return MagicMock(status=200, data=b'{"result": "success"}')
+        mock_http.request.side_effect = request
+        
+        client._getBearerToken()
+        with patch.object(client, '_query_oauth_for_token', wraps=client._query_oauth_for_token) as mock_query, \
+                ThreadPoolExecutor(max_workers=2) as pool:
+            results = list(pool.map(lambda _: client.v1Request("devices"), range(2)))
+        
+        self.assertEqual(results, [{"result": "success"}] * 2)
+        mock_query.assert_called_once()
+        self.assertEqual(client._bearer_token["access_token"], "second_token")
+
+    @patch('notehub.http')
+    @patch('time.time')
+    def test_slow_oauth_request_does_not_block_other_credentials(self, mock_time, mock_http):
+        """Test that a slow token request only holds up clients with the same credentials."""
+        mock_time.return_value = 1000
+        release = threading.Event()
+        
+        def request(method, url, headers=None, body=None):
+            if "secret_one" in body:
+                release.wait(5)
+            return MagicMock(status=200, data=b'{"access_token": "token", "expires_in": 3600}')
+        mock_http.request.side_effect = request
+        
+        slow_client, other_client = (
+            notehub.NotehubClientService(project_uid=self.project_uid, client_id=self.client_id, client_secret=secret)
+            for secret in ("secret_one", "secret_two")
+        )
+        slow = threading.Thread(target=slow_client._getBearerToken)
+        slow.start()
+        try:
+            other = threading.Thread(target=other_client._getBearerToken)
+            other.start()
+            other.join(1)
+            
+            self.assertFalse(other.is_alive())
+            self.assertEqual(other_client._bearer_token["access_token"], "token")
+        finally:
+            release.set()
+            slow.join()
+
+    @patch('notehub.http')
+    @patch('time.time')
+    def test_oauth_token_expiry_is_in_seconds(self, mock_time, mock_http):
+        """Test that expires_in is treated as seconds, less the refresh margin."""
+        mock_time.return_value = 1000
+        
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            client_id=self.client_id,
+            client_secret=self.client_secret
+        )
+        
+        token_response = MagicMock(status=200, data=b'{"access_token": "test_token", "expires_in": 3600}')
+        api_response = MagicMock(status=200, data=b'{"result": "success"}')
+        mock_http.request.side_effect = [token_response, api_response]
+        
+        client.v1Request("devices")
+        
+        self.assertEqual(client._bearer_token["expires_at"], 1000 + 3600)
+        mock_time.return_value = 1000 + 3600 - notehub.TOKEN_REFRESH_MARGIN_SECONDS
+        self.assertTrue(client._bearer_token_is_expired())
+
+    @patch('notehub.http')
+    @patch('time.time')
+    def test_oauth_token_refreshed_after_401(self, mock_time, mock_http):
+        """Test that a rejected OAuth token is replaced and the request sent once more."""
+        mock_time.return_value = 1000
+        
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            client_id=self.client_id,
+            client_secret=self.client_secret
+        )
+        
+        first_token = MagicMock(status=200, data=b'{"access_token": "first_token", "expires_in": 3600}')
+        second_token = MagicMock(status=200, data=b'{"access_token": "second_token", "expires_in": 3600}')
+        unauthorized = MagicMock(status=401, data=b'{"error": "Unauthorized"}')
+        api_response = MagicMock(status=200, data=b'{"result": "success"}')
+        mock_http.request.side_effect = [first_token, unauthorized, second_token, api_response]
+        
+        self.assertEqual(client.v1Request("devices"), {"result": "success"})
+        self.assertEqual(mock_http.request.call_count, 4)
+        self.assertEqual(mock_http.request.call_args_list[3][1]['headers']['Authorization'], 'Bearer second_token')
+
+    @patch('notehub.http')
+    @patch('time.time')
+    def test_oauth_401_after_refresh_raises(self, mock_time, mock_http):
+        """Test that a request is only retried once after a 401."""
+        mock_time.return_value = 1000
+        
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            client_id=self.client_id,
+            client_secret=self.client_secret
+        )
+        
+        token_response = MagicMock(status=200, data=b'{"access_token": "test_token", "expires_in": 3600}')
+        unauthorized = MagicMock(status=401, data=b'{"error": "Unauthorized"}')
+        mock_http.request.side_effect = [token_response, unauthorized, token_response, unauthorized]
+        
+        with self.assertRaises(Exception) as context:
+            client.v1Request("devices")
+        
+        self.assertEqual(str(context.exception), "Notehub authentication failed. Check API token(s)")
+        self.assertEqual(mock_http.request.call_count, 4)
+
+    @patch('notehub.http')
+    @patch('time.time')
+    def test_invalidate_bearer_token_twice(self, mock_time, mock_http):
+        """Test that discarding an already discarded OAuth token is a no-op."""
+        mock_time.return_value = 1000
+        
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            client_id=self.client_id,
+            client_secret=self.client_secret
+        )
+        
+        mock_http.request.return_value = MagicMock(status=200, data=b'{"access_token": "test_token", "expires_in": 3600}')
+        client._getBearerToken()
+        
+        client._invalidateBearerToken("test_token")
+        client._invalidateBearerToken("test_token")
+        
+        self.assertIsNone(client._bearer_token)
+        self.assertEqual(notehub._oauth_token_cache, {})
+
+    @patch('notehub.http')
+    @patch('time.time')
+    def test_oauth_401_retried_after_concurrent_invalidation(self, mock_time, mock_http):
+        """Test that a 401 is still retried when another request already discarded the token."""
+        mock_time.return_value = 1000
+        
+        client = notehub.NotehubClientService(
+            project_uid=self.project_uid,
+            client_id=self.client_id,
+            client_secret=self.client_secret
+        )
+        
+        first_token = MagicMock(status=200, data=b'{"access_token": "first_token", "expires_in": 3600}')
+        second_token = MagicMock(status=200, data=b'{"access_token": "second_token", "expires_in": 3600}')
+        unauthorized = MagicMock(status=401, data=b'{"error": "Unauthorized"}')
+        api_response = MagicMock(status=200, data=b'{"result": "success"}')
+        
+        responses = iter([first_token, unauthorized, second_token, api_response])
+        
+        def request(*args, **kwargs):
+            response = next(responses)
+            if response is unauthorized:
+                # Another request received a 401 for the same token while this one was in flight
+                client._invalidateBearerToken("first_token")
+            return response
+        
+        mock_http.request.side_effect = request
+        
+        self.assertEqual(client.v1Request("devices"), {"result": "success"})
+        self.assertEqual(mock_http.request.call_args_list[3][1]['headers']['Authorization'], 'Bearer second_token')
 
 class TestNotehubProject(unittest.TestCase):
     """Test cases for NotehubProject class."""
@@ -619,6 +1101,36 @@ class TestNotehubProject(unittest.TestCase):
         self.assertEqual(self.mock_client.v1Request.call_count, 2)
         self.assertEqual(len(result), 3)
 
+    def test_get_device_info_all_fetches_remaining_pages_concurrently(self):
+        """Test that all remaining pages are requested when the device total is reported."""
+        project = notehub.NotehubProject(client=self.mock_client)
+        pages = {
+            1: {"devices": [{"id": "dev1"}], "has_more": True, "total": 1001},
+            2: {"devices": [{"id": "dev2"}], "has_more": True, "total": 1001},
+            3: {"devices": [{"id": "dev3"}], "has_more": False, "total": 1001}
+        }
+        self.mock_client.v1Request.side_effect = lambda path, params: pages[params["pageNum"]]
+        
+        result = project.getDeviceInfo()
+        
+        self.assertEqual(self.mock_client.v1Request.call_count, 3)
+        self.assertEqual(result, [{"id": "dev1"}, {"id": "dev2"}, {"id": "dev3"}])
+
+    def test_get_device_info_all_follows_has_more_after_last_counted_page(self):
+        """Test that devices added after the total was reported are still fetched."""
+        project = notehub.NotehubProject(client=self.mock_client)
+        pages = {
+            1: {"devices": [{"id": "dev1"}], "has_more": True, "total": 1000},
+            2: {"devices": [{"id": "dev2"}], "has_more": True, "total": 1001},
+            3: {"devices": [{"id": "dev3"}], "has_more": False, "total": 1001}
+        }
+        self.mock_client.v1Request.side_effect = lambda path, params: pages[params["pageNum"]]
+        
+        result = project.getDeviceInfo()
+        
+        self.assertEqual(self.mock_client.v1Request.call_count, 3)
+        self.assertEqual(result, [{"id": "dev1"}, {"id": "dev2"}, {"id": "dev3"}])
+
     def test_provision_device(self):
         """Test device provisioning."""
         project = notehub.NotehubProject(client=self.mock_client)
@@ -778,6 +1290,72 @@ class TestNotehubProject(unittest.TestCase):
         
         self.assertIn("Device UID must be a string", str(context.exception))
 
+    def test_get_device_firmware_update_status_multiple(self):
+        """Test getting firmware update status for a list of devices."""
+        project = notehub.NotehubProject(client=self.mock_client)
+        self.mock_client.v1Request.side_effect = lambda path: {"path": path}
+        
+        result = project.getDeviceFirmwareUpdateStatus(["device123", "device456"], "notecard")
+        
+        self.assertEqual(result, [
+            {"path": "devices/device123/dfu/notecard/status"},
+            {"path": "devices/device456/dfu/notecard/status"}
+        ])
+
+    def test_get_device_firmware_update_status_bulk(self):
+        """Test getting firmware update status for many devices in groups."""
+        project = notehub.NotehubProject(client=self.mock_client)
+        devices = [f"dev:{i}" for i in range(notehub.DFU_STATUS_BULK_CHUNK_SIZE + 1)]
+        
+        def respond(path, params):
+            return {"devices": [{"device_uid": d, "dfu_in_progress": False} for d in params["deviceUID"]], "has_more": False}
+        self.mock_client.v1Request.side_effect = respond
+        
+        result = project.getDeviceFirmwareUpdateStatusBulk(devices, "notecard")
+        
+        self.assertEqual(self.mock_client.v1Request.call_count, 2)
+        self.assertEqual(set(result), set(devices))
+        self.assertEqual(result["dev:0"], {"device_uid": "dev:0", "dfu_in_progress": False})
+        for c in self.mock_client.v1Request.call_args_list:
+            self.assertEqual(c.args[0], "dfu/notecard/status")
+
+    def test_get_device_firmware_update_status_bulk_invalid_devices(self):
+        """Test that the bulk status request requires a list of device UIDs."""
+        project = notehub.NotehubProject(client=self.mock_client)
+        
+        with self.assertRaises(Exception) as context:
+            project.getDeviceFirmwareUpdateStatusBulk("dev:1", "notecard")
+        
+        self.assertIn("must be a list of strings", str(context.exception))
+        self.mock_client.v1Request.assert_not_called()
+
+    def test_get_device_firmware_update_status_all(self):
+        """Test getting both Notecard and Host firmware update status."""
+        project = notehub.NotehubProject(client=self.mock_client)
+        responses = {
+            "devices/device123/dfu/notecard/status": {"dfu_in_progress": True},
+            "devices/device123/dfu/host/status": {"dfu_in_progress": False}
+        }
+        self.mock_client.v1Request.side_effect = lambda path: responses[path]
+        
+        result = project.getDeviceFirmwareUpdateStatusAll("device123")
+        
+        self.assertEqual(result, {
+            "notecard": {"dfu_in_progress": True},
+            "host": {"dfu_in_progress": False}
+        })
+        self.assertEqual(self.mock_client.v1Request.call_count, 2)
+
+    def test_get_device_firmware_update_status_all_invalid_device(self):
+        """Test getting all firmware status with invalid device UID."""
+        project = notehub.NotehubProject(client=self.mock_client)
+        
+        with self.assertRaises(Exception) as context:
+            project.getDeviceFirmwareUpdateStatusAll(["device123"])
+        
+        self.assertIn("Device UID must be a string", str(context.exception))
+        self.mock_client.v1Request.assert_not_called()
+
     def test_request_device_firmware_update(self):
         """Test requesting device firmware update."""
         project = notehub.NotehubProject(client=self.mock_client)
@@ -227,6 +227,10 @@ class TestDevicesInUpdateFleetRules(unittest.TestCase):
         self.assertEqual(rules.minorVersion("7.5.1.12345"), 5)
         self.assertEqual(rules.minorVersion("10.2.0.1"), 2)
         
+        # Test parseVersion function
+        self.assertEqual(rules.parseVersion("8.1.3.17044"), (8, 1, 3, 17044))
+        self.assertEqual(rules.parseVersion("7.5.1"), (7, 5, 1))
+        
         # Test fleetsContain function
         fleet_checker = rules.fleetsContain("fleet:test")
         self.assertTrue(fleet_checker(["fleet:test"]))
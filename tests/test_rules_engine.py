@@ -6,14 +6,15 @@ testing generic rule matching with arbitrary field names, precedence, and target
 """
 
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 import sys
 import os
 
 # Add the parent directory to the path so we can import rules_engine
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from rules_engine import getFirmwareUpdateTargets
+from rules_engine import getFirmwareUpdateTargets, getFirmwareUpdateTargetsBatch, compile_rules
+import rules_engine
 
 
 class TestFirmwareUpdateTargets(unittest.TestCase):
@@ -442,5 +443,263 @@ class TestFirmwareUpdateTargets(unittest.TestCase):
         self.assertEqual(target_versions["notecard"], "8.1.4")
 
 
+
+class TestCompileRules(unittest.TestCase):
+    """Test cases for rule compilation and compiled rule caching."""
+
+    def test_compile_rules_resolves_ids_and_targets(self):
+        """Test that compiled rules carry resolved rule IDs and target versions."""
+        rules = [
+            {"id": "custom-id", "conditions": None, "target_versions": {"notecard": "8.1.4"}},
+            {"conditions": {"field": "value"}}
+        ]
+        
+        compiled = compile_rules(rules)
+        
+        self.assertEqual(len(compiled), 2)
+        self.assertEqual(compiled[0][:2], ("custom-id", {"notecard": "8.1.4"}))
+        self.assertEqual(compiled[0][2], ())
+        self.assertEqual(compiled[1][:2], ("rule-2", None))
+
+    def test_compile_rules_builds_predicates(self):
+        """Test that string conditions become exact match predicates and callables pass through."""
+        is_positive = lambda v: v > 0
+        compiled = compile_rules({"conditions": {"status": "active", "count": is_positive}})
+        
+        checks = dict(compiled[0][2])
+        self.assertTrue(checks["status"]("active"))
+        self.assertFalse(checks["status"]("inactive"))
+        self.assertIs(checks["count"], is_positive)
+
+    def test_compile_rules_orders_exact_matches_first(self):
+        """Test that exact match checks come before callables, which keep their order."""
+        first, second = (lambda v: True), (lambda v: True)
+        compiled = compile_rules({"conditions": {"a": first, "b": "value", "c": second, "d": 1}})
+        
+        self.assertEqual([field_name for field_name, _ in compiled[0][2]], ["b", "d", "a", "c"])
+
+    def test_callable_not_called_when_exact_match_fails(self):
+        """Test that a failing exact match condition skips the callable conditions of a rule."""
+        check = MagicMock(return_value=True)
+        rules = [{"id": "r", "conditions": {"count": check, "status": "active"}, "target_versions": "update"}]
+        
+        self.assertEqual(getFirmwareUpdateTargets({"count": 1, "status": "idle"}, rules=rules), (None, None))
+        check.assert_not_called()
+
+    def test_compiled_rules_are_cached_per_rule_set(self):
+        """Test that a rule set is only compiled once across evaluations."""
+        rules = [{"id": "cached", "conditions": {"field": "value"}, "target_versions": "update"}]
+        
+        with patch('rules_engine.compile_rules', wraps=rules_engine.compile_rules) as mock_compile:
+            getFirmwareUpdateTargets({"field": "value"}, rules=rules)
+            getFirmwareUpdateTargets({"field": "other"}, rules=rules)
+        
+        mock_compile.assert_called_once_with(rules)
+
+    def test_rules_list_changed_after_evaluation_is_recompiled(self):
+        """Test that rules added to or replaced in an evaluated rules list are used."""
+        rules = [{"id": "first", "conditions": {"field": "value"}, "target_versions": "update"}]
+        self.assertEqual(getFirmwareUpdateTargets({"field": "other"}, rules=rules), (None, None))
+        
+        rules.append({"id": "other", "conditions": {"field": "other"}, "target_versions": "other-update"})
+        self.assertEqual(getFirmwareUpdateTargets({"field": "other"}, rules=rules), ("other", "other-update"))
+        
+        rules[0] = {"id": "replaced", "conditions": {"field": "other"}, "target_versions": "replaced-update"}
+        self.assertEqual(getFirmwareUpdateTargets({"field": "other"}, rules=rules), ("replaced", "replaced-update"))
+
+    def test_batch_results_are_cached_by_condition_field_values(self):
+        """Test that devices in a batch with the same condition field values reuse the evaluation result."""
+        check = MagicMock(side_effect=lambda fleets: "fleet:a" in fleets)
+        rules = [{"id": "in-fleet", "conditions": {"fleets": check}, "target_versions": {"notecard": "8.1.4"}}]
+        devices = [
+            {"fleets": ["fleet:a"], "device": "dev:1"},
+            {"fleets": ["fleet:a"], "device": "dev:2"},
+            {"fleets": ["fleet:b"], "device": "dev:3"}
+        ]
+        
+        first, second, other = getFirmwareUpdateTargetsBatch(devices, rules=rules)
+        
+        self.assertEqual(first, ("in-fleet", {"notecard": "8.1.4"}))
+        self.assertEqual(second, first)
+        self.assertEqual(other, (None, None))
+        self.assertEqual(check.call_count, 2)
+
+    def test_conditions_evaluated_on_every_call(self):
+        """Test that single device evaluations don't reuse earlier results, so conditions may change over time."""
+        check = MagicMock(side_effect=[True, False])
+        rules = [{"id": "window", "conditions": {"fleets": check}, "target_versions": "update"}]
+        device_data = {"fleets": ["fleet:a"]}
+        
+        self.assertEqual(getFirmwareUpdateTargets(device_data, rules=rules), ("window", "update"))
+        self.assertEqual(getFirmwareUpdateTargets(device_data, rules=rules), (None, None))
+        self.assertEqual(check.call_count, 2)
+
+    def test_batch_results_cache_distinguishes_value_types(self):
+        """Test that values that compare equal across types are evaluated separately."""
+        rules = [{"id": "flag", "conditions": {"flag": lambda v: v is True}, "target_versions": "update"}]
+        
+        results = getFirmwareUpdateTargetsBatch([{"flag": True}, {"flag": 1}], rules=rules)
+        
+        self.assertEqual(results, [("flag", "update"), (None, None)])
+
+    def test_batch_unhashable_values_are_evaluated_without_caching(self):
+        """Test that rules still evaluate when a condition field value can't be hashed."""
+        check = MagicMock(return_value=True)
+        rules = [{"id": "info", "conditions": {"firmware_notecard": check}, "target_versions": "update"}]
+        device_data = {"firmware_notecard": {"version": "8.1.3"}}
+        
+        results = getFirmwareUpdateTargetsBatch([device_data, device_data], rules=rules)
+        
+        self.assertEqual(results, [("info", "update")] * 2)
+        self.assertEqual(check.call_count, 2)
+
+
+    def test_rules_after_unconditional_rule_are_not_evaluated(self):
+        """Test that rules following a rule without conditions are never checked."""
+        check = MagicMock(return_value=True)
+        rules = [
+            {"id": "always", "conditions": None, "target_versions": "update"},
+            {"id": "never", "conditions": {"field": check}, "target_versions": None}
+        ]
+        
+        self.assertEqual(getFirmwareUpdateTargets({"field": "value"}, rules=rules), ("always", "update"))
+        check.assert_not_called()
+
+    def test_default_rules_compiled_at_import(self):
+        """Test that DEFAULT_RULES is evaluated without being compiled on first use."""
+        with patch('rules_engine.compile_rules') as mock_compile:
+            result = getFirmwareUpdateTargets({"fleet": "fleet:any"})
+        
+        self.assertEqual(result, ("default", None))
+        mock_compile.assert_not_called()
+
+    def test_unconditional_rule_set_skips_field_resolution(self):
+        """Test that a rule set without conditions returns its result without reading device data."""
+        device_data = MagicMock()
+        
+        result = getFirmwareUpdateTargets(device_data, rules=rules_engine.DEFAULT_RULES)
+        
+        self.assertEqual(result, ("default", None))
+        device_data.get.assert_not_called()
+
+    def test_large_rule_sets_only_check_candidate_rules(self):
+        """Test that rules matching a different value of the indexed field are skipped."""
+        other_fleet_check = MagicMock(return_value=True)
+        rules = [
+            {"id": f"fleet-{n}", "conditions": {"fleet": f"fleet:{n}", "other": other_fleet_check}, "target_versions": n}
+            for n in range(rules_engine._RULE_INDEX_MIN_RULES)
+        ]
+        rules.append({"id": "any-fleet", "conditions": {"status": "active"}, "target_versions": "fallback"})
+        
+        self.assertEqual(getFirmwareUpdateTargets({"fleet": "fleet:3", "other": 1}, rules=rules), ("fleet-3", 3))
+        other_fleet_check.assert_called_once_with(1)
+        self.assertEqual(getFirmwareUpdateTargets({"fleet": "fleet:x", "status": "active"}, rules=rules), ("any-fleet", "fallback"))
+        other_fleet_check.assert_called_once_with(1)
+
+    def test_indexed_rule_sets_keep_rule_order(self):
+        """Test that the first matching rule wins when an unindexed rule comes before an indexed one."""
+        rules = [{"id": "first", "conditions": {"status": "active"}, "target_versions": "first"}]
+        rules += [
+            {"id": f"fleet-{n}", "conditions": {"fleet": f"fleet:{n}"}, "target_versions": n}
+            for n in range(rules_engine._RULE_INDEX_MIN_RULES)
+        ]
+        
+        self.assertEqual(getFirmwareUpdateTargets({"fleet": "fleet:1", "status": "active"}, rules=rules), ("first", "first"))
+        self.assertEqual(getFirmwareUpdateTargets({"fleet": "fleet:1", "status": "idle"}, rules=rules), ("fleet-1", 1))
+        self.assertEqual(getFirmwareUpdateTargets({"fleet": ["fleet:1"], "status": "idle"}, rules=rules), (None, None))
+
+class TestMatchOrder(unittest.TestCase):
+    """Test cases for evaluating rules with last-match-wins precedence."""
+
+    def setUp(self):
+        self.rules = [
+            {"id": "global", "conditions": None, "target_versions": {"notecard": "8.1.3"}},
+            {"conditions": {"fleet": "fleet:beta"}, "target_versions": {"notecard": "8.1.4"}}
+        ]
+
+    def test_last_match_wins(self):
+        """Test that later rules override earlier ones with match_order="last"."""
+        result = getFirmwareUpdateTargets({"fleet": "fleet:beta"}, rules=self.rules, match_order="last")
+        
+        self.assertEqual(result, ("rule-2", {"notecard": "8.1.4"}))
+
+    def test_last_match_falls_back_to_earlier_rules(self):
+        """Test that earlier rules still match when no later rule does."""
+        result = getFirmwareUpdateTargets({"fleet": "fleet:prod"}, rules=self.rules, match_order="last")
+        
+        self.assertEqual(result, ("global", {"notecard": "8.1.3"}))
+
+    def test_orders_are_cached_separately(self):
+        """Test that evaluating one order doesn't affect the other for the same rule set."""
+        device_data = {"fleet": "fleet:beta"}
+        
+        self.assertEqual(getFirmwareUpdateTargets(device_data, rules=self.rules, match_order="last")[0], "rule-2")
+        self.assertEqual(getFirmwareUpdateTargets(device_data, rules=self.rules)[0], "global")
+        self.assertEqual(getFirmwareUpdateTargetsBatch([device_data], rules=self.rules, match_order="last")[0][0], "rule-2")
+
+    def test_invalid_match_order(self):
+        """Test that an unknown match order is rejected."""
+        with self.assertRaises(Exception) as context:
+            getFirmwareUpdateTargets({}, rules=self.rules, match_order="random")
+        
+        self.assertIn("match_order must be one of", str(context.exception))
+
+    def test_field_getters_resolve_nested_paths(self):
+        """Test field getters for flat, single level and deeper dot notation fields."""
+        device_data = {
+            "fleet": "fleet:prod",
+            "firmware_notecard": {"version": "8.1.3", "build": {"number": 17044}},
+            "firmware_host": "not-a-dict"
+        }
+        
+        cases = [
+            ("fleet", "fleet:prod"),
+            ("missing", None),
+            ("firmware_notecard.version", "8.1.3"),
+            ("firmware_notecard.missing", None),
+            ("firmware_host.version", None),
+            ("missing.version", None),
+            ("firmware_notecard.build.number", 17044),
+            ("firmware_notecard.version.major", None),
+            ("missing.build.number", None)
+        ]
+        for field_name, expected in cases:
+            with self.subTest(field_name=field_name):
+                self.assertEqual(rules_engine._fieldGetter(field_name)(device_data), expected)
+
+class TestFirmwareUpdateTargetsBatch(unittest.TestCase):
+    """Test cases for evaluating many devices against one rule set."""
+
+    def test_batch_matches_individual_evaluation(self):
+        """Test that batch results match per-device evaluation, in device order."""
+        rules = [
+            {"id": "nested", "conditions": {"firmware_notecard.version": "8.1.3"}, "target_versions": {"notecard": "8.1.4"}},
+            {"id": "prod", "conditions": {"fleet": "fleet:prod"}, "target_versions": None}
+        ]
+        devices = [
+            {"fleet": "fleet:prod", "firmware_notecard": {"version": "8.1.3"}},
+            {"fleet": "fleet:prod"},
+            {"fleet": "fleet:dev"}
+        ]
+        
+        result = getFirmwareUpdateTargetsBatch(devices, rules=rules)
+        
+        self.assertEqual(result, [getFirmwareUpdateTargets(d, rules=rules) for d in devices])
+        self.assertEqual(result, [("nested", {"notecard": "8.1.4"}), ("prod", None), (None, None)])
+
+    def test_batch_compiles_rules_once(self):
+        """Test that the rule set is looked up once per batch rather than per device."""
+        rules = [{"id": "r", "conditions": {"field": "value"}, "target_versions": "update"}]
+        devices = [{"field": "value"}, {"field": "other"}, {}]
+        
+        with patch('rules_engine._getCompiledRules', wraps=rules_engine._getCompiledRules) as mock_get:
+            getFirmwareUpdateTargetsBatch(devices, rules=rules)
+        
+        mock_get.assert_called_once_with(rules, "first")
+
+    def test_batch_empty(self):
+        """Test that an empty batch returns an empty list."""
+        self.assertEqual(getFirmwareUpdateTargetsBatch([]), [])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file